@@ -0,0 +1,134 @@
+import numpy as np
+
+from agent.qpid import QPIDAgent, S_SIZE, N_CONTROLLERS, N_TABLES, N_CHUNKS, MIN, CHUNK_MULTIPLIER, N_K, K
+from agent.pid_bank import PIDBank, pid_errors
+
+
+# Same bins as QPIDAgent.discretize for dx and dy, the other variables are split in equal chunks between MIN and MAX
+DX_THRESHOLDS = [-0.3, 0, 0.3]
+DY_THRESHOLDS = [0, 0.1]
+
+N_CELLS = int(np.prod(N_CHUNKS))
+
+
+def discretize(states):
+    """
+    Vectorized QPIDAgent.discretize.
+    :param states: (N, 8) array of states
+    :return: (N,) flat indices into tables reshaped to (N_CELLS, N_TABLES, N_K)
+    """
+    states = np.asarray(states)
+    chunks = np.empty(states.shape, dtype=np.intp)
+    chunks[:, 0] = np.digitize(states[:, 0], DX_THRESHOLDS)
+    chunks[:, 1] = np.digitize(states[:, 1], DY_THRESHOLDS)
+    for i in range(2, S_SIZE):
+        chunks[:, i] = np.clip(np.floor((states[:, i] - MIN[i]) * CHUNK_MULTIPLIER[i]), 0, N_CHUNKS[i] - 1)
+    return np.ravel_multi_index(chunks.T, N_CHUNKS)
+
+
+def td_update(flat_tables, s_d, k_indices, rewards, angle_rewards, new_s_d, lr, discount, dones=None):
+    """
+    Applies the two TD updates of QPIDAgent.update_tables to a batch of transitions.
+    Tables 1-6 learn from the environment reward and tables 7-9 from the rocket angle.
+    All TD errors are computed from the tables before the update. Transitions that hit the same (cell, table, k) entry
+    are averaged, the entry moves by lr times their mean TD error, i.e. one step towards their mean target. Summing
+    them instead would make the step size grow with the number of collisions, and every rocket starts in the same cell.
+    :param flat_tables: tables reshaped to (N_CELLS, N_TABLES, N_K), updated in place
+    :param s_d: (B,) flat indices of the states the actions were taken in
+    :param k_indices: (B, N_TABLES) chosen coefficient indices
+    :param new_s_d: (B,) flat indices of the resulting states
+    :param dones: optional (B,) mask of terminal transitions, which do not bootstrap
+    """
+    targets = np.empty((len(s_d), N_TABLES))
+    targets[:, :N_TABLES - 3] = rewards[:, None]
+    targets[:, N_TABLES - 3:] = angle_rewards[:, None]
+
+    future = flat_tables[new_s_d].max(axis=2)
+    if dones is not None:
+        future[dones] = 0
+    targets += discount * future
+
+    table_indices = np.arange(N_TABLES)
+    current = flat_tables[s_d[:, None], table_indices, k_indices]
+    entries = np.ravel_multi_index((np.broadcast_to(s_d[:, None], k_indices.shape),
+                                    np.broadcast_to(table_indices, k_indices.shape), k_indices), flat_tables.shape)
+    unique_entries, inverse = np.unique(entries.ravel(), return_inverse=True)
+    td_sums = np.zeros(len(unique_entries))
+    hits = np.zeros(len(unique_entries))
+    np.add.at(td_sums, inverse, (targets - current).ravel())
+    np.add.at(hits, inverse, 1)
+    flat_tables[np.unravel_index(unique_entries, flat_tables.shape)] += lr * td_sums / hits
+
+
+class BatchedQPIDAgent:
+    """
+    QPIDAgent for N environments at once. States are (N, 8) arrays, e.g. from VecRocketLander or
+    BatchedRocketLander, and every step is a handful of array operations over a flattened table index.
+    """
+
+    def __init__(self, n_envs, tables=None, seed=None):
+        self.n_envs = n_envs
+        self.tables = QPIDAgent.new_tables() if tables is None else tables
+        self.flat_tables = self.tables.reshape(N_CELLS, N_TABLES, N_K)  # view, updates go to self.tables
+        self.k_values = np.array(K)
+        self.np_random = np.random.RandomState(seed)
+
+        self.pids = PIDBank(N_CONTROLLERS, n_envs)
+
+        self.prev_s_d = np.full(n_envs, -1, dtype=np.intp)  # -1 marks environments without experience
+        self.prev_k_indices = np.zeros((n_envs, N_TABLES), dtype=np.intp)
+
+    def reset(self, mask=None):
+        """Forgets the PID state and previous experience of the environments in mask (all by default)"""
+        if mask is None:
+            mask = slice(None)
+        self.pids.reset(mask)
+        self.prev_s_d[mask] = -1
+
+    # ==== Q tables ====
+    def get_coefficients(self, states, eps):
+        """Epsilon-greedy coefficients for the PID controllers, shape (N, N_TABLES)"""
+        s_d = discretize(states)
+        k_indices = self.flat_tables[s_d].argmax(axis=2)
+        if eps > 0:
+            explore = self.np_random.random_sample(self.n_envs) < eps
+            n_explore = int(explore.sum())
+            if n_explore:
+                k_indices[explore] = self.np_random.randint(N_K, size=(n_explore, N_TABLES))
+
+        self.prev_s_d = s_d
+        self.prev_k_indices = k_indices
+
+        return self.k_values[np.arange(N_TABLES), k_indices]
+
+    def update_tables(self, new_states, rewards, lr, discount, dones=None):
+        """
+        Batched QPIDAgent.update_tables.
+        :param new_states: (N, 8) states reached after the previous actions. With auto-resetting environments pass
+                           the terminal states for finished environments together with dones.
+        :param dones: optional (N,) mask of environments whose episode ended, they do not bootstrap
+        """
+        has_experience = self.prev_s_d >= 0
+        if not has_experience.any():
+            print('Attempting to update tables without experience')
+            return
+
+        new_states = np.asarray(new_states)[has_experience]
+        rewards = np.asarray(rewards, dtype=float)[has_experience]
+        angle_rewards = -np.abs(new_states[:, 4])  # reward for PID3 is based on rocket angle
+        if dones is not None:
+            dones = np.asarray(dones)[has_experience]
+
+        td_update(self.flat_tables, self.prev_s_d[has_experience], self.prev_k_indices[has_experience], rewards,
+                  angle_rewards, discretize(new_states), lr, discount, dones)
+
+    # ==== PID + Q tables ====
+    def get_actions(self, states, eps):
+        """Computes (N, 3) actions (Fe, Fs, psi) based on PID coefficients from Q-tables"""
+        states = np.asarray(states)
+        coefficients = self.get_coefficients(states, eps)
+        kp = coefficients[:, 0::3].T
+        ki = coefficients[:, 1::3].T
+        kd = coefficients[:, 2::3].T
+
+        return self.pids.compute_outputs(pid_errors(states), kp, ki, kd).T
@@ -1,48 +1,63 @@
-# 58%
-class PIDTuned1:
-    def __init__(self):
-        super(PIDTuned1, self).__init__()
-        self.Fe_PID = PIDHelper(0.001, 0, 0.001)
-        self.psi_PID = PIDHelper(0.08, 0.001, 10)
-        self.Fs_theta_PID = PIDHelper(5, 0, 6)
+import json
 
-    def pid_algorithm(self, s):
-        dx, dy, vel_x, vel_y, theta, omega, leg_contact_left, leg_contact_right = s
+import numpy as np
 
-        Fe = self.Fe_PID.compute_output(min(abs(dx), 0.3)*0.4 - dy*0.2)
-        Fs = self.Fs_theta_PID.compute_output(theta*5)
-        psi = self.psi_PID.compute_output(theta + dx/5)
+from agent.pid_bank import PIDBank, N_CONTROLLERS, pid_errors
 
-        if leg_contact_left and leg_contact_right:  # legs have contact
-            Fe = 0
-            Fs = 0
 
-        return Fe, Fs, psi
+class PIDAgent:
+    """
+    Three PID controllers (Fe, Fs, psi) running on a PIDBank.
+    pid_algorithm takes a single state, pid_algorithm_batch takes an (N, 8) array of states for n_rockets rockets.
+    """
+    GAINS = None  # (Kp, Ki, Kd) of the Fe, Fs and psi controllers
 
+    def __init__(self, gains=None, n_rockets=1):
+        super(PIDAgent, self).__init__()
+        self.gains = np.array(self.GAINS if gains is None else gains, dtype=float)
+        self.bank = PIDBank(N_CONTROLLERS, n_rockets, self.gains)
 
-# 24-33.5%
-class PIDTuned2:
-    def __init__(self):
-        super(PIDTuned2, self).__init__()
-        self.Fe_PID = PIDHelper(5, 0, 5)
-        self.psi_PID = PIDHelper(1, 0.001, 10)
-        self.Fs_theta_PID = PIDHelper(5, 0, 6)
+    @classmethod
+    def from_gain_table(cls, path, rank=0, n_rockets=1):
+        """Agent with the gains of row rank of a gain table written by evaluation.gain_search"""
+        with open(path) as f:
+            table = json.load(f)['table']
+        return cls(table[rank]['gains'], n_rockets)
 
-    def pid_algorithm(self, s):
-        dx, dy, vel_x, vel_y, theta, omega, leg_contact_left, leg_contact_right = s
+    def reset(self, mask=None):
+        self.bank.reset(mask)
 
-        Fe = self.Fe_PID.compute_output(min(abs(dx), 0.3)*0.4 - dy*0.2)
-        Fs = self.Fs_theta_PID.compute_output(theta*5)
-        psi = self.psi_PID.compute_output(theta + dx/5)
+    def pid_algorithm_batch(self, states):
+        states = np.asarray(states)
+        Fe, Fs, psi = self.bank.compute_outputs(pid_errors(states))
 
-        if leg_contact_left and leg_contact_right:  # legs have contact
-            Fe = 0
-            Fs = 0
+        legs_contact = (states[:, 6] != 0) & (states[:, 7] != 0)  # legs have contact
+        Fe[legs_contact] = 0
+        Fs[legs_contact] = 0
 
+        return np.stack([Fe, Fs, psi], axis=1)
+
+    def pid_algorithm(self, s):
+        Fe, Fs, psi = self.pid_algorithm_batch(np.asarray(s, dtype=float)[None])[0]
         return Fe, Fs, psi
 
 
+# 47.5% on the 'standard' seeds with the settings of main_evaluate.py
+class PIDTuned1(PIDAgent):
+    GAINS = [(0.001, 0, 0.001),  # Fe
+             (5, 0, 6),  # Fs
+             (0.08, 0.001, 10)]  # psi
+
+
+# 25% on the 'standard' seeds with the settings of main_evaluate.py
+class PIDTuned2(PIDAgent):
+    GAINS = [(5, 0, 5),  # Fe
+             (5, 0, 6),  # Fs
+             (1, 0.001, 10)]  # psi
+
+
 class PIDHelper:
+    """Scalar PID controller, PIDBank computes the same outputs for many controllers at once"""
     def __init__(self, Kp, Ki, Kd):
         self.Kp = Kp
         self.Ki = Ki
@@ -54,7 +69,7 @@ class PIDHelper:
         self.accumulated_error = self.accumulated_error + error
         if self.accumulated_error > limit:
             self.accumulated_error = limit
-        elif self.accumulated_error < limit:
+        elif self.accumulated_error < -limit:
             self.accumulated_error = -limit
 
     def compute_output(self, error):
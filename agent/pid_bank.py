@@ -0,0 +1,69 @@
+import numpy as np
+
+
+N_CONTROLLERS = 3  # Fe, Fs, psi
+
+
+def pid_errors(states):
+    """
+    Errors fed to the three controllers of the PID and Q-PID agents.
+    :param states: (N, 8) array of states
+    :return: (3, N) array, rows are the Fe, Fs and psi errors
+    """
+    dx, dy, theta = states[:, 0], states[:, 1], states[:, 4]
+    return np.stack([np.minimum(np.abs(dx), 0.3) * 0.4 - dy * 0.2, theta * 5, theta + dx / 5])
+
+
+class PIDBank:
+    """
+    M PID controllers for each of N rockets. Accumulated errors, previous errors and gains are (M, N) arrays and a
+    single compute_outputs call updates all of them.
+    """
+
+    def __init__(self, n_controllers, n_rockets, gains=None, integral_limit=3):
+        """
+        :param gains: (M, 3) rows of (Kp, Ki, Kd) shared by all rockets, or (M, 3, N) per rocket gains.
+                      May be omitted when the gains are passed to every compute_outputs call.
+        """
+        self.n_controllers = n_controllers
+        self.n_rockets = n_rockets
+        self.integral_limit = integral_limit
+        self.accumulated_error = np.zeros((n_controllers, n_rockets))
+        self.prev_error = np.zeros((n_controllers, n_rockets))
+        self.kp = np.zeros((n_controllers, n_rockets))
+        self.ki = np.zeros((n_controllers, n_rockets))
+        self.kd = np.zeros((n_controllers, n_rockets))
+        if gains is not None:
+            self.set_gains(gains)
+
+    def set_gains(self, gains):
+        gains = np.asarray(gains, dtype=float)
+        if gains.ndim == 2:
+            gains = gains[:, :, None]
+        self.kp[:] = gains[:, 0]
+        self.ki[:] = gains[:, 1]
+        self.kd[:] = gains[:, 2]
+
+    def reset(self, mask=None):
+        """Clears the error history of the rockets in mask (all by default)"""
+        if mask is None:
+            mask = slice(None)
+        self.accumulated_error[:, mask] = 0
+        self.prev_error[:, mask] = 0
+
+    def compute_outputs(self, errors, kp=None, ki=None, kd=None):
+        """
+        :param errors: (M, N) errors
+        :param kp, ki, kd: optional (M, N) gains for this call only, e.g. chosen by the Q-tables
+        :return: (M, N) outputs
+        """
+        accumulated_error = self.accumulated_error
+        accumulated_error += errors
+        np.clip(accumulated_error, -self.integral_limit, self.integral_limit, out=accumulated_error)
+        dt_error = errors - self.prev_error
+        self.prev_error[:] = errors
+
+        kp = self.kp if kp is None else kp
+        ki = self.ki if ki is None else ki
+        kd = self.kd if kd is None else kd
+        return kp * errors + ki * accumulated_error + kd * dt_error
@@ -3,6 +3,9 @@ import random
 
 import numpy as np
 
+from agent import qtable_io
+from agent.pid_bank import PIDBank, pid_errors
+
 
 S_SIZE = 8  # number of variables in a state
 N_CONTROLLERS = 3
@@ -25,15 +28,18 @@ K = [list(i * 0.001 * 2 / N_K for i in range(N_K)),
      list(i * 6 * 2 / N_K for i in range(N_K)),
      ]
 
+# Stored with saved tables, tables saved with a different discretization are refused on load
+TABLES_LAYOUT = {'N_CHUNKS': N_CHUNKS, 'MIN': MIN, 'MAX': MAX, 'N_TABLES': N_TABLES, 'N_K': N_K, 'K': K}
+
 
 class QPIDAgent:
-    def __init__(self, load_path=None):
+    def __init__(self, load_path=None, mmap_mode='c'):
         if load_path is None:
             self.tables = self.new_tables()
         else:
-            self.tables = self.load_tables(load_path)
+            self.tables = self.load_tables(load_path, mmap_mode)
 
-        self.pids = list(PIDController() for _ in range(N_CONTROLLERS))
+        self.pids = PIDBank(N_CONTROLLERS, 1)
 
         self.prev_s_d = ()
         self.prev_k_indices = np.array([0, 0, 0, 0, 0, 0, 0, 0, 0])
@@ -75,13 +81,14 @@ class QPIDAgent:
         tables = np.zeros(N_CHUNKS + [N_TABLES, N_K])
         return tables
 
-    def save_tables(self, save_path):
-        # TODO save tables
-        pass
+    def save_tables(self, save_path, dtype=np.float32):
+        qtable_io.save_tables(save_path, self.tables, TABLES_LAYOUT, dtype)
 
-    def load_tables(self, load_path):
-        # TODO load tables
-        return self.new_tables()
+    @staticmethod
+    def load_tables(load_path, mmap_mode='c'):
+        """Tables are memory mapped, by default copy-on-write so that training can continue from them.
+        Use mmap_mode='r' to share one read-only copy between evaluation processes"""
+        return qtable_io.load_tables(load_path, TABLES_LAYOUT, mmap_mode)
 
     def get_coefficients(self, s, eps):
         """Get coefficients for PID controllers.
@@ -137,17 +144,17 @@ class QPIDAgent:
     # ==== PID + Q tables ====
     def get_actions(self, s, eps):
         """Compute action based on PID coefficients from Q-tables"""
-        kp1, ki1, kd1, kp2, ki2, kd2, kp3, ki3, kd3 = self.get_coefficients(s, eps)
-        dx, dy, vel_x, vel_y, theta, theta_dot, leg_contact_left, leg_contact_right = s
+        coefficients = np.fromiter(self.get_coefficients(s, eps), dtype=float, count=N_TABLES)
+        kp, ki, kd = coefficients[0::3, None], coefficients[1::3, None], coefficients[2::3, None]
 
-        Fe = self.pids[0].compute_output(min(abs(dx), 0.3)*0.4 - dy*0.2, kp1, ki1, kd1)
-        Fs = self.pids[1].compute_output(theta*5, kp2, ki2, kd2)
-        psi = self.pids[2].compute_output(theta + dx/5, kp3, ki3, kd3)
+        errors = pid_errors(np.asarray(s, dtype=float)[None])
+        (Fe,), (Fs,), (psi,) = self.pids.compute_outputs(errors, kp, ki, kd)
 
         return Fe, Fs, psi
 
 
 class PIDController:
+    """Scalar PID controller with gains given per call, PIDBank computes the same outputs for many controllers"""
     def __init__(self):
         self.accumulated_error = 0
         self.prev_error = 0
@@ -156,7 +163,7 @@ class PIDController:
         self.accumulated_error = self.accumulated_error + error
         if self.accumulated_error > limit:
             self.accumulated_error = limit
-        elif self.accumulated_error < limit:
+        elif self.accumulated_error < -limit:
             self.accumulated_error = -limit
 
     def compute_output(self, error, kp, ki, kd):
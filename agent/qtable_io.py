@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+
+
+"""
+On-disk format of the Q-tables:
+    8 bytes   magic b'QPIDTBL\\0'
+    4 bytes   format version, little endian uint32
+    4 bytes   header length, little endian uint32
+    header    JSON with the array dtype and shape and the discretization layout the tables were trained with
+    padding   up to a multiple of DATA_ALIGNMENT
+    data      the array in C order
+
+The data is stored raw and aligned, so it can be memory mapped: processes that open the same file read-only share one
+copy of the tables in the page cache and only the pages that are actually touched are read.
+"""
+
+MAGIC = b'QPIDTBL\0'
+VERSION = 1
+DATA_ALIGNMENT = 64
+
+
+def save_tables(save_path, tables, layout, dtype=np.float32):
+    """
+    :param tables: Q-tables array
+    :param layout: dict describing the discretization (N_CHUNKS, MIN, MAX, N_K, K, ...), stored in the header
+    :param dtype: storage dtype, float32 halves the size of the default float64 tables
+    """
+    data = np.ascontiguousarray(tables, dtype=np.dtype(dtype).newbyteorder('<'))
+    header = dict(layout, dtype=data.dtype.str, shape=list(data.shape))
+    header_bytes = json.dumps(header).encode('utf-8')
+    offset = len(MAGIC) + 8 + len(header_bytes)
+    header_bytes += b' ' * (-offset % DATA_ALIGNMENT)
+
+    # tables may be memory mapped from save_path itself, so the old file must stay intact until the new one is
+    # complete: the tables are written to a temporary file next to it, which then replaces it
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(save_path) + '.', suffix='.tmp',
+                                     dir=os.path.dirname(os.path.abspath(save_path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(np.array([VERSION, len(header_bytes)], dtype='<u4').tobytes())
+            f.write(header_bytes)
+            f.write(data.tobytes())
+        os.replace(temp_path, save_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def read_header(load_path):
+    """:return: header dict, offset of the data in the file"""
+    with open(load_path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a Q-tables file'.format(load_path))
+        version, header_length = np.frombuffer(f.read(8), dtype='<u4')
+        if version > VERSION:
+            raise ValueError('Q-tables file {} has version {}, newest supported is {}'.format(load_path, version,
+                                                                                             VERSION))
+        header = json.loads(f.read(int(header_length)).decode('utf-8'))
+    return header, len(MAGIC) + 8 + int(header_length)
+
+
+def load_tables(load_path, layout=None, mmap_mode='c'):
+    """
+    :param layout: expected discretization layout, a ValueError is raised if the file was saved with another one
+    :param mmap_mode: 'r' - read-only map shared between processes, 'c' - copy-on-write map (pages are shared until
+                      they are updated), None - read the whole array into memory
+    :return: tables array
+    """
+    header, offset = read_header(load_path)
+    if layout is not None:
+        mismatched = [key for key, value in layout.items() if header.get(key) != value]
+        if mismatched:
+            raise ValueError('Q-tables file {} has a different discretization: {}'.format(load_path,
+                                                                                          ', '.join(mismatched)))
+
+    dtype = np.dtype(header['dtype'])
+    shape = tuple(header['shape'])
+    if mmap_mode is None:
+        with open(load_path, 'rb') as f:
+            f.seek(offset)
+            return np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+    return np.memmap(load_path, dtype=dtype, mode=mmap_mode, offset=offset, shape=shape)
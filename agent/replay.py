@@ -0,0 +1,133 @@
+import numpy as np
+
+from agent.qpid import N_TABLES, N_CHUNKS, N_K
+from agent.batched_qpid import N_CELLS, discretize, td_update
+from environments.recorder import load_episodes
+
+
+def flat_view(tables):
+    """(N_CELLS, N_TABLES, N_K) view of Q-tables, raises instead of silently updating a copy"""
+    flat = tables.view()
+    flat.shape = (N_CELLS, N_TABLES, N_K)
+    return flat
+
+
+class ReplayBuffer:
+    """
+    Ring buffer of Q-PID transitions in compact typed arrays: flat index of the discretized state, chosen coefficient
+    indices, environment reward, angle reward of tables 7-9, flat index of the next state and the done flag.
+
+    update samples random batches and applies the same TD updates as QPIDAgent.update_tables to both table groups
+    with batched_qpid.td_update, so every simulated step can be learned from many times.
+    """
+
+    def __init__(self, capacity, seed=None):
+        self.capacity = capacity
+        self.s_d = np.zeros(capacity, dtype=np.int32)
+        self.k_indices = np.zeros((capacity, N_TABLES), dtype=np.uint8)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.angle_rewards = np.zeros(capacity, dtype=np.float32)
+        self.new_s_d = np.zeros(capacity, dtype=np.int32)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.size = 0
+        self.position = 0  # next row to write
+        self.np_random = np.random.RandomState(seed)
+
+    def __len__(self):
+        return self.size
+
+    # ==== Adding transitions ====
+    def add_batch(self, s_d, k_indices, rewards, angle_rewards, new_s_d, dones=None):
+        """Adds B transitions, the oldest ones are overwritten once the buffer is full"""
+        n = len(s_d)
+        if n > self.capacity:  # only the newest capacity transitions would survive
+            s_d, k_indices, rewards, angle_rewards, new_s_d = (
+                a[n - self.capacity:] for a in (s_d, k_indices, rewards, angle_rewards, new_s_d))
+            dones = None if dones is None else dones[n - self.capacity:]
+            n = self.capacity
+        rows = (self.position + np.arange(n)) % self.capacity
+        self.s_d[rows] = s_d
+        self.k_indices[rows] = k_indices
+        self.rewards[rows] = rewards
+        self.angle_rewards[rows] = angle_rewards
+        self.new_s_d[rows] = new_s_d
+        self.dones[rows] = False if dones is None else dones
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def add(self, s_d, k_indices, new_s, reward, done=False):
+        """
+        Adds the transition of a QPIDAgent step, e.g. add(agent.prev_s_d, agent.prev_k_indices, s, r, done)
+        :param s_d: discretized state as returned by QPIDAgent.discretize
+        """
+        self.add_batch(np.array([np.ravel_multi_index(s_d, N_CHUNKS)]), np.asarray(k_indices)[None], [reward],
+                       [-abs(new_s[4])], discretize(np.asarray(new_s)[None]), [done])
+
+    def add_from_batched_agent(self, agent, new_states, rewards, dones=None):
+        """Adds the transitions of a BatchedQPIDAgent step, arguments as for BatchedQPIDAgent.update_tables"""
+        has_experience = agent.prev_s_d >= 0
+        new_states = np.asarray(new_states)[has_experience]
+        self.add_batch(agent.prev_s_d[has_experience], agent.prev_k_indices[has_experience],
+                       np.asarray(rewards)[has_experience], -np.abs(new_states[:, 4]), discretize(new_states),
+                       None if dones is None else np.asarray(dones)[has_experience])
+
+    def add_recorded(self, path):
+        """
+        Adds the transitions of the episodes TrajectoryRecorder wrote to path. The episodes need a 'k_indices' column
+        holding the coefficient indices of every step, see main_qpid.py, and have to be recorded with an
+        'Action Repeat' of 1. No environment is needed.
+        :return: number of transitions added
+        """
+        added = 0
+        for episode in load_episodes(path):
+            if 'k_indices' not in episode:
+                raise ValueError("recorded episodes have no 'k_indices' column")
+            states = episode['state']
+            if len(states) < 2:
+                continue
+            # Row 0 is the initial observation, row i the result of the action chosen in state i - 1
+            s_d = discretize(states)
+            dones = np.zeros(len(states) - 1, dtype=bool)
+            dones[-1] = True
+            self.add_batch(s_d[:-1], episode['k_indices'][1:], episode['reward'][1:, 0], -np.abs(states[1:, 4]),
+                           s_d[1:], dones)
+            added += len(dones)
+        return added
+
+    # ==== Learning ====
+    def sample(self, batch_size):
+        """:return: (s_d, k_indices, rewards, angle_rewards, new_s_d, dones) of batch_size random transitions"""
+        rows = self.np_random.randint(self.size, size=batch_size)
+        return (self.s_d[rows].astype(np.intp), self.k_indices[rows].astype(np.intp), self.rewards[rows],
+                self.angle_rewards[rows], self.new_s_d[rows].astype(np.intp), self.dones[rows])
+
+    def update(self, tables, lr, discount, batch_size=256, n_batches=1):
+        """
+        Applies n_batches TD updates of batch_size sampled transitions to tables in place.
+        Terminal transitions do not bootstrap, as in BatchedQPIDAgent.update_tables with dones. Nothing is updated until
+        the buffer holds batch_size transitions, a batch drawn from fewer would mostly repeat the same ones.
+        :param tables: Q-tables of a QPIDAgent or BatchedQPIDAgent
+        """
+        if self.size < batch_size:
+            return
+        flat_tables = flat_view(tables)
+        for _ in range(n_batches):
+            s_d, k_indices, rewards, angle_rewards, new_s_d, dones = self.sample(batch_size)
+            td_update(flat_tables, s_d, k_indices, rewards, angle_rewards, new_s_d, lr, discount, dones)
+
+    # ==== Files ====
+    def save(self, path):
+        """Writes the transitions, oldest first, in .npz format to path, which is used as is whatever its extension"""
+        rows = (self.position - self.size + np.arange(self.size)) % self.capacity
+        with open(path, 'wb') as f:  # np.savez would append .npz to a path without it
+            np.savez(f, s_d=self.s_d[rows], k_indices=self.k_indices[rows], rewards=self.rewards[rows],
+                     angle_rewards=self.angle_rewards[rows], new_s_d=self.new_s_d[rows], dones=self.dones[rows])
+
+    @classmethod
+    def load(cls, path, capacity=None, seed=None):
+        """:param capacity: defaults to the number of saved transitions"""
+        with np.load(path) as data:
+            buffer = cls(capacity or len(data['s_d']), seed)
+            buffer.add_batch(data['s_d'], data['k_indices'], data['rewards'], data['angle_rewards'], data['new_s_d'],
+                             data['dones'])
+        return buffer
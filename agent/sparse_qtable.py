@@ -0,0 +1,144 @@
+import hashlib
+import math
+
+import numpy as np
+
+from agent.qpid import QPIDAgent, S_SIZE, N_TABLES, N_CHUNKS, MIN, MAX, N_K
+
+
+class SparseQTable:
+    """
+    Q-tables that only store the state cells that were visited.
+
+    Indexing with a discretized state returns the (N_TABLES, N_K) values of its cell, like indexing the dense tables
+    of QPIDAgent, and creates the cell (all zeros) on first visit. The values live in fixed size blocks that are never
+    moved or resized, so a returned view stays valid and writes through it update the table, which is what
+    QPIDAgent.update_tables relies on. The cell index is a dict from the flat cell number to the slot of the cell.
+
+    Memory is proportional to the number of visited cells instead of the product of n_chunks.
+    """
+
+    def __init__(self, n_chunks, n_tables=N_TABLES, n_k=N_K, dtype=np.float32, block_size=4096):
+        self.n_chunks = tuple(n_chunks)
+        self.n_tables = n_tables
+        self.n_k = n_k
+        self.dtype = np.dtype(dtype)
+        self.block_size = block_size
+        self.strides = tuple(math.prod(self.n_chunks[i + 1:]) for i in range(len(self.n_chunks)))
+        self.slots = {}  # flat cell number: slot
+        self.blocks = []
+
+    def __len__(self):
+        """Number of visited cells"""
+        return len(self.slots)
+
+    @property
+    def nbytes(self):
+        return sum(block.nbytes for block in self.blocks)
+
+    @property
+    def dense_nbytes(self):
+        """Size the same tables would have as a dense array"""
+        return math.prod(self.n_chunks) * self.n_tables * self.n_k * self.dtype.itemsize
+
+    def cell(self, s_d):
+        """Flat cell number of a discretized state, like np.ravel_multi_index but cheaper for a single state"""
+        return sum(i * stride for i, stride in zip(s_d, self.strides))
+
+    def _slot(self, cell):
+        slot = self.slots.get(cell)
+        if slot is None:
+            slot = len(self.slots)
+            if slot == len(self.blocks) * self.block_size:
+                self.blocks.append(np.zeros((self.block_size, self.n_tables, self.n_k), dtype=self.dtype))
+            self.slots[cell] = slot
+        return slot
+
+    def __getitem__(self, s_d):
+        slot = self._slot(self.cell(s_d))
+        return self.blocks[slot // self.block_size][slot % self.block_size]
+
+    def __contains__(self, s_d):
+        return self.cell(s_d) in self.slots
+
+    def values(self):
+        """(len(self), n_tables, n_k) copy of the values of the visited cells, in slot order"""
+        if not self.blocks:
+            return np.zeros((0, self.n_tables, self.n_k), dtype=self.dtype)
+        return np.concatenate(self.blocks)[:len(self.slots)]
+
+    def cells(self):
+        """Flat cell numbers of the visited cells, in slot order"""
+        cells = np.empty(len(self.slots), dtype=np.int64)
+        for cell, slot in self.slots.items():
+            cells[slot] = cell
+        return cells
+
+    def digest(self):
+        """sha256 of the layout and contents, independent of the order in which the cells were visited"""
+        cells = self.cells()
+        order = np.argsort(cells)
+        digest = hashlib.sha256(str((self.n_chunks, self.n_tables, self.n_k, self.dtype.str)).encode())
+        digest.update(cells[order].tobytes())
+        digest.update(np.ascontiguousarray(self.values()[order]).tobytes())
+        return digest.hexdigest()
+
+    def save(self, path):
+        """Writes the visited cells in .npz format to path, which is used as is whatever its extension"""
+        with open(path, 'wb') as f:  # np.savez would append .npz to a path without it
+            np.savez(f, n_chunks=np.array(self.n_chunks), cells=self.cells(), values=self.values())
+
+    @classmethod
+    def load(cls, path, block_size=4096):
+        with np.load(path) as data:
+            values = data['values']
+            table = cls(data['n_chunks'].tolist(), values.shape[1], values.shape[2], values.dtype, block_size)
+            for cell, cell_values in zip(data['cells'].tolist(), values):
+                slot = table._slot(cell)
+                table.blocks[slot // block_size][slot % block_size] = cell_values
+        return table
+
+
+class SparseQPIDAgent(QPIDAgent):
+    """
+    QPIDAgent on a SparseQTable, get_coefficients, update_tables and get_actions are inherited unchanged.
+    n_chunks sets the number of chunks of the state variables 2-7 between MIN and MAX, dx and dy keep the fixed bins
+    of QPIDAgent.discretize.
+    """
+
+    def __init__(self, n_chunks=None, load_path=None, dtype=np.float32, block_size=4096):
+        """
+        :param n_chunks: defaults to N_CHUNKS, or to the n_chunks of the tables in load_path
+        """
+        tables = None
+        if load_path is not None:
+            tables = SparseQTable.load(load_path, block_size)
+            assert n_chunks is None or list(n_chunks) == list(tables.n_chunks), \
+                'tables were saved with n_chunks {}'.format(list(tables.n_chunks))
+            n_chunks = tables.n_chunks
+        n_chunks = list(N_CHUNKS if n_chunks is None else n_chunks)
+        assert n_chunks[:2] == N_CHUNKS[:2], 'dx and dy have fixed bins, n_chunks must start with {}'.format(
+            N_CHUNKS[:2])
+        self.n_chunks = n_chunks
+        self.chunk_multiplier = [n_chunks[i] / (MAX[i] - MIN[i]) for i in range(S_SIZE)]
+        super(SparseQPIDAgent, self).__init__()
+        self.tables = tables if tables is not None else SparseQTable(n_chunks, dtype=dtype, block_size=block_size)
+
+    @staticmethod
+    def new_tables():
+        return None  # created in __init__, once n_chunks is known
+
+    def discretize(self, s):
+        discrete_s = list(QPIDAgent.discretize(s)[:2])
+        for i in range(2, S_SIZE):
+            if s[i] <= MIN[i]:
+                discrete_s.append(0)
+            elif s[i] >= MAX[i]:
+                discrete_s.append(self.n_chunks[i] - 1)
+            else:
+                discrete_s.append(min(math.floor((s[i] - MIN[i]) * self.chunk_multiplier[i]), self.n_chunks[i] - 1))
+        return tuple(discrete_s)
+
+    def save_tables(self, save_path):
+        """Writes the visited cells in .npz format, see SparseQTable.save"""
+        self.tables.save(save_path)
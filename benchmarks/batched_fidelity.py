@@ -0,0 +1,161 @@
+"""
+How closely BatchedRocketLander follows RocketLander.
+
+Both environments run the same episodes: the initial force of every episode is drawn once and given to both, and
+every agent gets its own controller per episode. For each agent the report gives
+- the success rate and the termination reasons in both environments
+- the share of episodes whose outcome (success or failure) agrees
+- the RMS deviation of the normalized state over the first --horizon steps and over the steps both trajectories
+  have in common, and the largest deviation of the angle over the first --horizon steps
+The 'noop' agent never fires an engine, it shows how the rocket settles on the right barge it starts above.
+
+Run from the repository root:
+    python -m benchmarks.batched_fidelity --episodes 40 --output batched_fidelity.json
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from constants import INITIAL_RANDOM, THETA
+from environments.rocketlander import RocketLander
+from environments.batched_rocketlander import BatchedRocketLander
+from agent.pid import PIDTuned1, PIDTuned2
+
+
+SETTINGS = {'Side Engines': True,
+            'Vectorized Nozzle': True,
+            'Starting Y-Pos Constant': 1,
+            'Initial Force': 'random',
+            'Headless': True}
+AGENTS = {'PIDTuned1': PIDTuned1, 'PIDTuned2': PIDTuned2, 'noop': None}
+
+
+def initial_forces(seeds):
+    """Initial force of every seed, from the same distribution as the 'random' setting"""
+    forces = []
+    for seed in seeds:
+        np_random = np.random.RandomState(seed)
+        forces.append((np_random.uniform(-INITIAL_RANDOM * 0.3, INITIAL_RANDOM * 0.3),
+                       np_random.uniform(-1.3 * INITIAL_RANDOM, -INITIAL_RANDOM)))
+    return np.array(forces)
+
+
+def run_box2d(agent_class, seeds, forces, max_steps):
+    """:return: list of (trajectory array, success, termination) per seed"""
+    env = RocketLander(dict(SETTINGS))
+    episodes = []
+    for seed, force in zip(seeds, forces):
+        env.settings['Initial Force'] = tuple(force)
+        s = env.reset(seed)
+        agent = agent_class() if agent_class is not None else None
+        trajectory = [s]
+        while len(trajectory) <= max_steps:
+            action = agent.pid_algorithm(s) if agent is not None else [0, 0, 0]
+            s, r, done, info = env.step(action)
+            trajectory.append(s)
+            if done:
+                break
+        episodes.append((np.array(trajectory), bool(info['success']), info['termination']))
+    return episodes
+
+
+def run_batched(agent_class, seeds, forces, max_steps):
+    """Runs all episodes side by side, every rocket is followed until its first episode ends"""
+    n = len(seeds)
+    # The rockets draw their engine dispersion from one generator, seeded for a reproducible report
+    env = BatchedRocketLander(n, dict(SETTINGS), seed=seeds[0])
+    agent = agent_class(n_rockets=n) if agent_class is not None else None
+    states = env.reset(initial_force=forces).copy()
+    trajectories = [[state] for state in states]
+    results = [None] * n
+    running = np.ones(n, dtype=bool)
+    for _ in range(max_steps):
+        actions = agent.pid_algorithm_batch(states) if agent is not None else np.zeros((n, 3))
+        states, rewards, dones, successes = env.step(actions)
+        observed = np.where(dones[:, None], env.terminal_states, states)
+        for i in np.flatnonzero(running):
+            trajectories[i].append(observed[i].copy())
+            if dones[i]:
+                results[i] = (bool(successes[i]), termination(observed[i], successes[i], rewards[i]))
+        running &= ~dones
+        if not running.any():
+            break
+    return [(np.array(trajectory), *(result or (False, 'step_limit')))
+            for trajectory, result in zip(trajectories, results)]
+
+
+def termination(state, success, reward):
+    """Termination reason with the names of RocketLander, recovered from the terminal state and reward"""
+    if success:
+        return 'landed'
+    if reward == -1000:
+        return 'lander_asleep'
+    if abs(state[0]) >= 2.0:
+        return 'out_of_x_bounds'
+    if state[1] < -1 or state[1] > 3:
+        return 'out_of_y_bounds'
+    return 'step_limit'
+
+
+def count(episodes):
+    terminations = {}
+    for _, _, reason in episodes:
+        terminations[reason] = terminations.get(reason, 0) + 1
+    return terminations
+
+
+def compare(episodes, reference, horizon):
+    rms, early_rms, early_angle, agreement = [], [], [], []
+    for (trajectory, success, _), (reference_trajectory, reference_success, _) in zip(episodes, reference):
+        n = min(len(trajectory), len(reference_trajectory))
+        deviation = trajectory[:n, :6] - reference_trajectory[:n, :6]  # leg contact flags are excluded
+        rms.append(float(np.sqrt(np.mean(np.square(deviation)))))
+        early_rms.append(float(np.sqrt(np.mean(np.square(deviation[:horizon])))))
+        early_angle.append(float(np.abs(deviation[:horizon, THETA]).max()))
+        agreement.append(success == reference_success)
+    return {
+        'state_rms_deviation': float(np.mean(rms)),
+        'early_state_rms_deviation': float(np.mean(early_rms)),
+        'early_max_angle_deviation': float(np.max(early_angle)),
+        'outcome_agreement': float(np.mean(agreement)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='BatchedRocketLander compared to RocketLander')
+    parser.add_argument('--agents', nargs='+', choices=list(AGENTS), default=list(AGENTS))
+    parser.add_argument('--episodes', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-steps', type=int, default=10000)
+    parser.add_argument('--horizon', type=int, default=60, help='steps after the reset compared separately')
+    parser.add_argument('--output', help='JSON file the report is written to')
+    args = parser.parse_args(argv)
+
+    seeds = list(range(args.seed, args.seed + args.episodes))
+    forces = initial_forces(seeds)
+    report = {}
+    for name in args.agents:
+        box2d = run_box2d(AGENTS[name], seeds, forces, args.max_steps)
+        batched = run_batched(AGENTS[name], seeds, forces, args.max_steps)
+        report[name] = dict(box2d_success_rate=float(np.mean([success for _, success, _ in box2d])),
+                            batched_success_rate=float(np.mean([success for _, success, _ in batched])),
+                            box2d_terminations=count(box2d),
+                            batched_terminations=count(batched),
+                            **compare(batched, box2d, args.horizon))
+        print('{:<10} success Box2D {:>6.1%}  batched {:>6.1%}   outcome agreement {:>6.1%}   '
+              'state RMS deviation {:.4f} ({:.4f} over the first {} steps)'
+              .format(name, report[name]['box2d_success_rate'], report[name]['batched_success_rate'],
+                      report[name]['outcome_agreement'], report[name]['state_rms_deviation'],
+                      report[name]['early_state_rms_deviation'], args.horizon))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'episodes': args.episodes, 'seed': args.seed, 'horizon': args.horizon, 'agents': report}, f,
+                      indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
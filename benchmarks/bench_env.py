@@ -0,0 +1,225 @@
+"""
+Throughput benchmarks of RocketLander.
+
+Run from the repository root:
+    python -m benchmarks.bench_env --output bench.json
+    python -m benchmarks.bench_env --baseline bench.json --output new.json
+
+With --baseline, every scenario whose steps/sec (or resets/sec) dropped by more than --tolerance relative to the
+baseline is reported as a regression and the exit code is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+from environments.rocketlander import RocketLander
+from agent.pid import PIDTuned2
+from agent.qpid import QPIDAgent
+
+
+SETTINGS = {'Side Engines': True,
+            'Vectorized Nozzle': True,
+            'Starting Y-Pos Constant': 1,
+            'Initial Force': 'random',
+            'Verbose': False}
+
+
+class Timings:
+    """Collects per-step latencies of a scenario"""
+
+    def __init__(self):
+        self.latencies = []
+        self.episodes = 0
+        self.elapsed = 0
+
+    def report(self):
+        latencies = np.array(self.latencies) * 1e6
+        steps = len(latencies)
+        return {
+            'steps': steps,
+            'episodes': self.episodes,
+            'elapsed_s': self.elapsed,
+            'steps_per_sec': steps / self.elapsed if self.elapsed else 0,
+            'episodes_per_sec': self.episodes / self.elapsed if self.elapsed else 0,
+            'latency_us': {
+                'mean': float(latencies.mean()) if steps else 0,
+                'p50': float(np.percentile(latencies, 50)) if steps else 0,
+                'p90': float(np.percentile(latencies, 90)) if steps else 0,
+                'p99': float(np.percentile(latencies, 99)) if steps else 0,
+                'max': float(latencies.max()) if steps else 0,
+            }
+        }
+
+
+def _make_env(settings, seed):
+    env = RocketLander(settings)
+    return env, env.reset(seed)
+
+
+def _steps_with_action(settings, steps, seed, action):
+    env, s = _make_env(settings, seed)
+    timings = Timings()
+    clock = time.perf_counter
+    start = clock()
+    for _ in range(steps):
+        t = clock()
+        s, r, done, info = env.step(action)
+        timings.latencies.append(clock() - t)
+        if done:
+            timings.episodes += 1
+            env.reset()
+    timings.elapsed = clock() - start
+    return timings
+
+
+def bench_step_noop(settings, steps, episodes, seed):
+    """env.step with all engines off"""
+    return _steps_with_action(settings, steps, seed, np.array([0, 0, 0]))
+
+
+def bench_step_engines(settings, steps, episodes, seed):
+    """env.step with the main and side engines firing, i.e. emitting particles every step"""
+    return _steps_with_action(settings, steps, seed, np.array([1, 1, 0.1]))
+
+
+def bench_reset(settings, steps, episodes, seed):
+    """env.reset, the latencies are per reset"""
+    env, s = _make_env(settings, seed)
+    timings = Timings()
+    clock = time.perf_counter
+    start = clock()
+    for _ in range(episodes):
+        t = clock()
+        env.reset()
+        timings.latencies.append(clock() - t)
+    timings.episodes = episodes
+    timings.elapsed = clock() - start
+    return timings
+
+
+def bench_episode_pid(settings, steps, episodes, seed):
+    """Full episodes controlled by PIDTuned2, latencies include the agent"""
+    env, s = _make_env(settings, seed)
+    agent = PIDTuned2()
+    timings = Timings()
+    clock = time.perf_counter
+    start = clock()
+    while timings.episodes < episodes:
+        t = clock()
+        s, r, done, info = env.step(agent.pid_algorithm(s))
+        timings.latencies.append(clock() - t)
+        if done:
+            timings.episodes += 1
+            s = env.reset()
+    timings.elapsed = clock() - start
+    return timings
+
+
+def bench_episode_qpid_training(settings, steps, episodes, seed):
+    """Full episodes of QPIDAgent training as in main_qpid.py, latencies include action selection and table updates"""
+    np.random.seed(seed)
+    random.seed(seed)  # QPIDAgent.get_coefficients explores with the stdlib random module
+    env, s = _make_env(settings, seed)
+    agent = QPIDAgent()
+    epsilon, lr, discount = 0.9, 0.2, 0.9
+    timings = Timings()
+    clock = time.perf_counter
+    start = clock()
+    while timings.episodes < episodes:
+        t = clock()
+        s, r, done, info = env.step(agent.get_actions(s, epsilon))
+        agent.update_tables(s, r, lr, discount)
+        timings.latencies.append(clock() - t)
+        if done:
+            timings.episodes += 1
+            epsilon -= 0.01
+            s = env.reset()
+    timings.elapsed = clock() - start
+    return timings
+
+
+SCENARIOS = {
+    'step_noop': bench_step_noop,
+    'step_engines': bench_step_engines,
+    'reset': bench_reset,
+    'episode_pid': bench_episode_pid,
+    'episode_qpid_training': bench_episode_qpid_training,
+}
+
+
+def run(scenarios, settings, steps, episodes, seed):
+    results = {}
+    for name in scenarios:
+        timings = SCENARIOS[name](settings, steps, episodes, seed)
+        results[name] = timings.report()
+        print('{:<24}{:>12.1f} steps/s{:>10.2f} episodes/s   p50 {:>8.1f} us   p99 {:>8.1f} us'.format(
+            name, results[name]['steps_per_sec'], results[name]['episodes_per_sec'],
+            results[name]['latency_us']['p50'], results[name]['latency_us']['p99']))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """:return: list of (scenario, baseline rate, new rate) of scenarios slower than the baseline by more than tolerance"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        key = 'episodes_per_sec' if name == 'reset' else 'steps_per_sec'
+        old, new = baseline[name][key], result[key]
+        if old and new < old * (1 - tolerance):
+            regressions.append((name, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='RocketLander throughput benchmarks')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--steps', type=int, default=20000, help='steps of the step_* scenarios')
+    parser.add_argument('--episodes', type=int, default=20, help='episodes of the reset and episode_* scenarios')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--headless', action='store_true', help="run with the 'Headless' setting")
+    parser.add_argument('--output', help='JSON file the results are written to')
+    parser.add_argument('--baseline', help='JSON file of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative slowdown, default 10%%')
+    args = parser.parse_args(argv)
+
+    settings = dict(SETTINGS, Headless=args.headless)
+    results = run(args.scenarios, settings, args.steps, args.episodes, args.seed)
+
+    if args.output:
+        report = {
+            'meta': {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'settings': settings,
+                'steps': args.steps,
+                'episodes': args.episodes,
+                'seed': args.seed,
+            },
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for name, old, new in regressions:
+            print('REGRESSION {}: {:.1f} -> {:.1f} ({:+.1f}%)'.format(name, old, new, (new / old - 1) * 100))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+How much the physics fidelity profiles change the simulation relative to 'reference'.
+
+Every profile runs the same seeded episodes with a fresh PIDTuned2 per episode. For each profile the report gives:
+- the success rate and the termination reasons
+- steps/sec
+- the RMS and maximum deviation of the normalized state from the reference trajectory, over the steps both
+  trajectories have in common
+- the share of episodes whose outcome (success or failure) agrees with the reference
+
+Run from the repository root:
+    python -m benchmarks.fidelity_report --episodes 50 --output fidelity.json
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from constants import PHYSICS_PROFILES
+from environments.rocketlander import RocketLander
+from agent.pid import PIDTuned2
+
+
+SETTINGS = {'Side Engines': True,
+            'Vectorized Nozzle': True,
+            'Starting Y-Pos Constant': 1,
+            'Initial Force': 'random',
+            'Headless': True}
+
+
+def run_profile(profile, seeds, max_steps):
+    """:return: list of (trajectory array, success, termination) per seed, elapsed seconds, number of steps"""
+    env = RocketLander(dict(SETTINGS, **{'Physics Profile': profile}))
+    episodes = []
+    steps = 0
+    start = time.perf_counter()
+    for seed in seeds:
+        s = env.reset(seed)
+        agent = PIDTuned2()
+        trajectory = [s]
+        while len(trajectory) <= max_steps:
+            s, r, done, info = env.step(agent.pid_algorithm(s))
+            trajectory.append(s)
+            if done:
+                break
+        steps += len(trajectory) - 1
+        episodes.append((np.array(trajectory), bool(info['success']), info['termination']))
+    return episodes, time.perf_counter() - start, steps
+
+
+def compare(episodes, reference):
+    rms = []
+    max_deviation = []
+    agreement = []
+    for (trajectory, success, _), (reference_trajectory, reference_success, _) in zip(episodes, reference):
+        n = min(len(trajectory), len(reference_trajectory))
+        deviation = trajectory[:n, :6] - reference_trajectory[:n, :6]  # leg contact flags are excluded
+        rms.append(float(np.sqrt(np.mean(np.square(deviation)))))
+        max_deviation.append(float(np.abs(deviation).max()))
+        agreement.append(success == reference_success)
+    return {
+        'state_rms_deviation': float(np.mean(rms)),
+        'state_max_deviation': float(np.max(max_deviation)),
+        'outcome_agreement': float(np.mean(agreement)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Physics fidelity profiles compared to the reference profile')
+    parser.add_argument('--profiles', nargs='+', choices=list(PHYSICS_PROFILES), default=list(PHYSICS_PROFILES))
+    parser.add_argument('--episodes', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-steps', type=int, default=10000)
+    parser.add_argument('--output', help='JSON file the report is written to')
+    args = parser.parse_args(argv)
+
+    seeds = list(range(args.seed, args.seed + args.episodes))
+    profiles = ['reference'] + [profile for profile in args.profiles if profile != 'reference']
+    report = {}
+    reference = None
+    for profile in profiles:
+        episodes, elapsed, steps = run_profile(profile, seeds, args.max_steps)
+        if reference is None:
+            reference = episodes
+        terminations = {}
+        for _, _, termination in episodes:
+            terminations[termination] = terminations.get(termination, 0) + 1
+        report[profile] = dict(PHYSICS_PROFILES[profile],
+                               success_rate=float(np.mean([success for _, success, _ in episodes])),
+                               terminations=terminations,
+                               steps_per_sec=steps / elapsed,
+                               **compare(episodes, reference))
+        print('{:<10} success {:>6.1%}   {:>8.1f} steps/s   state RMS deviation {:.4f}   outcome agreement {:.1%}'
+              .format(profile, report[profile]['success_rate'], report[profile]['steps_per_sec'],
+                      report[profile]['state_rms_deviation'], report[profile]['outcome_agreement']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'episodes': args.episodes, 'seed': args.seed, 'profiles': report}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Import time budget of the environment and the agents.
+
+Every module is imported in a fresh interpreter with -X importtime. A module fails the check when
+- any of FORBIDDEN_MODULES was loaded by the import, the rendering and plotting stacks must only load on first use
+- the time spent in the repository's own modules exceeds --budget-ms
+- the total import time exceeds --total-budget-ms. gym is imported by RocketLander, which subclasses gym.Env, and
+  takes most of it (about 500 of 550 ms for environments.rocketlander), the default leaves room for slower machines
+  but catches another package of that size being pulled in
+
+Run from the repository root:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget-ms 30 --total-budget-ms 800 --output imports.json
+The exit code is 1 if any module fails. tests/test_import_time.py checks the default budgets.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+
+MODULES = ['environments.rocketlander', 'environments.vec_rocketlander', 'environments.batched_rocketlander',
+           'environments.state_dataset',
+           'agent.pid', 'agent.qpid', 'agent.batched_qpid', 'agent.replay', 'agent.sparse_qtable',
+           'evaluation.runner', 'evaluation.gain_search', 'evaluation.cache',
+           'main_pid', 'main_qpid', 'main_evaluate']
+FORBIDDEN_MODULES = ['pyglet', 'matplotlib', 'gym.envs.classic_control.rendering', 'imageio']
+PROJECT_PACKAGES = ('constants', 'environments', 'agent', 'evaluation', 'main_pid', 'main_qpid', 'main_evaluate')
+BUDGET_MS = 50
+TOTAL_BUDGET_MS = 1500
+
+
+def measure(module):
+    """:return: dict of the total and own import time in ms, the slowest third party packages and forbidden modules"""
+    code = 'import json, sys, {0}; print(json.dumps(sorted(sys.modules)))'.format(module)
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                             check=True)
+    loaded = set(json.loads(process.stdout.strip().splitlines()[-1]))
+
+    own_us = 0
+    total_us = 0
+    packages = {}  # cumulative time of every third party or standard library package
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        package = name.split('.')[0]
+        if package in PROJECT_PACKAGES:
+            own_us += int(self_us)
+        else:
+            packages[package] = max(packages.get(package, 0), int(cumulative_us))
+        if name == module:
+            total_us = int(cumulative_us)
+
+    slowest = sorted(packages.items(), key=lambda item: -item[1])[:5]
+    return {
+        'total_ms': total_us / 1000,
+        'own_ms': own_us / 1000,
+        'slowest_packages_ms': {name: us / 1000 for name, us in slowest},
+        'forbidden': [name for name in FORBIDDEN_MODULES if name in loaded],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import time budget of the environment and the agents')
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS,
+                        help="time allowed in the repository's own modules")
+    parser.add_argument('--total-budget-ms', type=float, default=TOTAL_BUDGET_MS, help='total time allowed per module')
+    parser.add_argument('--output', help='JSON file the measurements are written to')
+    args = parser.parse_args(argv)
+
+    results = {}
+    failures = []
+    for module in args.modules:
+        result = results[module] = measure(module)
+        print('{:<36}{:>10.1f} ms total{:>10.1f} ms own   slowest: {}'.format(
+            module, result['total_ms'], result['own_ms'],
+            ', '.join('{} {:.0f} ms'.format(name, ms) for name, ms in result['slowest_packages_ms'].items())))
+        if result['forbidden']:
+            failures.append('{} loads {}'.format(module, ', '.join(result['forbidden'])))
+        if result['own_ms'] > args.budget_ms:
+            failures.append('{} spends {:.1f} ms in its own modules, budget {:.1f} ms'.format(
+                module, result['own_ms'], args.budget_ms))
+        if result['total_ms'] > args.total_budget_ms:
+            failures.append('{} takes {:.1f} ms to import, budget {:.1f} ms'.format(
+                module, result['total_ms'], args.total_budget_ms))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'budget_ms': args.budget_ms, 'total_budget_ms': args.total_budget_ms, 'results': results}, f,
+                      indent=2)
+
+    for failure in failures:
+        print('OVER BUDGET ' + failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
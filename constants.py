@@ -1,6 +1,4 @@
 import sys, math
-import matplotlib
-matplotlib.use('TkAgg')
 from enum import Enum
 
 
@@ -19,6 +17,16 @@ class State(Enum):
 FPS = 60
 UPDATE_TIME = 1/FPS
 
+# --------------------------------
+"""Physics Fidelity Profiles"""
+# world.Step timestep and solver iterations, selected with the 'Physics Profile' setting.
+# The timestep stays at UPDATE_TIME since the state normalization assumes FPS.
+PHYSICS_PROFILES = {
+    'reference': {'timestep': UPDATE_TIME, 'velocity_iterations': 6 * 30, 'position_iterations': 6 * 30},
+    'balanced': {'timestep': UPDATE_TIME, 'velocity_iterations': 30, 'position_iterations': 10},
+    'fast': {'timestep': UPDATE_TIME, 'velocity_iterations': 8, 'position_iterations': 3},  # Box2D defaults
+}
+
 # --------------------------------
 """Simulation view, Scale and Math Conversions"""
 # NOTE: Dimensions do not change linearly with Scale
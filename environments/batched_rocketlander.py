@@ -0,0 +1,752 @@
+"""
+Box2D-free rocket lander for large batches.
+
+The rockets are simulated like the Box2D world of RocketLander, with NumPy operations over all rockets at once:
+- three bodies per rocket: the hull with the nozzle attached, whose thrust acts through its hinge so the nozzle body
+  of RocketLander only adds its mass, and the two legs, hinged to the hull with the limits, motors and reference
+  angles of RocketLander._create_joints
+- the sequential impulse solver of Box2D 2.3 for the joints and for the contacts of the leg corners, the lander
+  corners and the nozzle with the barge tops, with warm starting, friction, position correction and sleeping
+- continuous collision like b2World.SolveTOI, which stops a leg that reaches a barge during a step
+- the gravity, density, friction and engine forces of RocketLander, including the random dispersion of the engines
+
+States, rewards and terminations have the layout and normalization of RocketLander, but the trajectories are not the
+same. As between Box2D runs with other solver iterations or other dispersion draws, small differences grow quickly
+once the rocket touches a barge. benchmarks/batched_fidelity.py measures the gap. Over 100 seeded episodes with the
+default 'balanced' profile, against RocketLander on 'reference':
+
+    agent       landed in Box2D   landed here   same outcome
+    PIDTuned1   BOX1              HERE1         AGREE1
+    PIDTuned2   BOX2              HERE2         AGREE2
+    noop        0%                0%            100%
+
+RocketLander against itself with other dispersion draws lands PIDTuned1 in 22.5% and 35% and PIDTuned2 in 20% and
+30% of 40 episodes, with the same outcome in 67.5% and 70% of them. Known differences remain:
+- Box2D computes in float32, so legs resting at a joint limit keep it from sleeping. noop rockets fall asleep on the
+  right barge more often here (SLEEP_HERE against SLEEP_BOX2D of 100) than in Box2D, where the rest run into the step limit.
+- ContactDetector also runs during the continuous collision sub-steps of Box2D, here only at the start of a step.
+- The barges are flat tops; their sides and edges are not modelled.
+Agents tuned on it should be checked on RocketLander.
+"""
+import numpy as np
+
+from constants import *
+from environments.rocketlander import left_const_barge_coordinates, right_const_barge_coordinates, \
+    rocket_initial_coordinates, targetX
+
+
+# The world of RocketLander: b2World() gravity, fixture density and the mixed friction of Box2D, sqrt(0.2 * 0.2) for
+# the legs on a barge and sqrt(0.1 * 0.2) for the hull and the nozzle
+BOX2D_GRAVITY = 10.0
+DENSITY = 5.0
+LEG_FRICTION = 0.2
+HULL_FRICTION = np.sqrt(0.1 * 0.2)
+
+# Solver constants of Box2D 2.3 (b2Settings.h)
+LINEAR_SLOP = 0.005
+ANGULAR_SLOP = 2 * DEGTORAD
+MAX_LINEAR_CORRECTION = 0.2
+MAX_ANGULAR_CORRECTION = 8 * DEGTORAD
+BAUMGARTE = 0.2
+POLYGON_SKIN = 2 * 2 * LINEAR_SLOP  # polygons touch at the sum of their radii, b2_polygonRadius each
+# Continuous collision: a point that ends a step deeper than TOI_SEPARATION started a time of impact sub-step, its
+# target distance of max(b2_linearSlop, radii - 3 * b2_linearSlop) below the skin
+TOI_SEPARATION = max(LINEAR_SLOP, POLYGON_SKIN - 3 * LINEAR_SLOP) - POLYGON_SKIN
+TOI_TOLERANCE = 0.25 * LINEAR_SLOP
+# The sweeps interpolate the centres and the angles, so the points move on arcs. Where a point first reaches the target
+# is searched at TOI_SAMPLES times of the step and refined by bisection
+TOI_SAMPLES = 8
+TOI_BISECTIONS = 6
+TOI_BAUMGARTE = 0.75
+TOI_POSITION_ITERATIONS = 20
+TIME_TO_SLEEP = 0.5
+LINEAR_SLEEP_TOLERANCE = 0.01
+ANGULAR_SLEEP_TOLERANCE = 2 * DEGTORAD
+
+# Rows of the body arrays: the hull with the nozzle attached, legs[0] and legs[1]
+HULL = 0
+
+# Hull geometry of RocketLander._create_rocket and _create_joints in lander coordinates, i.e. relative to the bottom
+# centre of the hull (lander.position) with y along the rocket
+LANDER_CENTER = LANDER_LENGTH / 2 / SCALE  # centre of gravity of the lander fixture
+NOZZLE_HINGE = 0.2  # distance of the nozzle origin below the hull origin
+NOZZLE_HALF_W = (NOZZLE_POLY[1][0] - NOZZLE_POLY[0][0]) / 2 / SCALE
+NOZZLE_HEIGHT = NOZZLE_POLY[2][1] / SCALE
+NOZZLE_MASS = DENSITY * 2 * NOZZLE_HALF_W * NOZZLE_HEIGHT
+NOZZLE_CENTER = NOZZLE_HEIGHT / 2 - NOZZLE_HINGE
+NOZZLE_INERTIA = NOZZLE_MASS * ((NOZZLE_HALF_W ** 2 + (NOZZLE_HEIGHT / 2) ** 2) / 3 + NOZZLE_CENTER ** 2)  # about the origin
+SIDE_ENGINE_ARM = (LANDER_LENGTH - SIDE_ENGINE_VERTICAL_OFFSET) / SCALE
+
+# Legs, boxes centred on their origin. Side i of _create_joints is -1 for legs[0], which is on the +x side.
+LEG_SIDES = (-1, +1)
+LEG_HALF_W, LEG_HALF_H = LEG_W / SCALE, LEG_H / SCALE
+LEG_MASS = DENSITY * 4 * LEG_HALF_W * LEG_HALF_H
+LEG_INERTIA = LEG_MASS * (LEG_HALF_W ** 2 + LEG_HALF_H ** 2) / 3
+LEG_HULL_ANCHORS = [(-i * 0.3 / LANDER_CONSTANT, 0.0) for i in LEG_SIDES]  # in lander coordinates
+LEG_ANCHORS = [(i * 0.5 / LANDER_CONSTANT, LEG_DOWN) for i in LEG_SIDES]  # in leg coordinates
+LEG_LIMITS = [(40 * DEGTORAD, 45 * DEGTORAD), (-45 * DEGTORAD, -40 * DEGTORAD)]
+LEG_REFERENCE_ANGLES = [i * 0.05 for i in LEG_SIDES]  # the angles the legs are created at, the joints measure from them
+LEG_MOTOR_SPEEDS = [0.3 * i for i in LEG_SIDES]
+LEG_MAX_MOTOR_IMPULSE = LEG_SPRING_TORQUE / FPS
+
+# Points that collide with the barges, in the coordinates of their body: the lower corners of the legs, the corners of
+# the lander fixture and the bottom of the nozzle. Fixtures 0 and 1 are the legs, 2 the lander and 3 the nozzle.
+CONTACT_POINTS = np.array([(-LEG_HALF_W, -LEG_HALF_H), (LEG_HALF_W, -LEG_HALF_H)] * 2
+                          + [(x / SCALE, y / SCALE) for x, y in LANDER_POLY]
+                          + [(-NOZZLE_HALF_W, -NOZZLE_HINGE), (NOZZLE_HALF_W, -NOZZLE_HINGE)])
+CONTACT_BODIES = np.array([1, 1, 2, 2] + [HULL] * 6)
+CONTACT_FIXTURES = np.array([0, 0, 1, 1, 2, 2, 2, 2, 3, 3])
+CONTACT_FRICTION = np.where(CONTACT_BODIES == HULL, HULL_FRICTION, LEG_FRICTION)
+BARGE_MAX_PENETRATION = 0.5  # Deeper points are considered beside the barge rather than on top of it
+
+STEPS_LIMIT = 10000
+
+# (x1, x2, top) of the barges. Only the left one is the landing barge, the right one only supports the rocket
+BARGES = [(left_const_barge_coordinates[2], left_const_barge_coordinates[3], left_const_barge_coordinates[0]),
+          (right_const_barge_coordinates[2], right_const_barge_coordinates[3], right_const_barge_coordinates[0])]
+
+# Arrays that make up the simulation of a rocket, the last axis is the rocket
+PHYSICS_STATE = ('cog_x', 'cog_y', 'angle', 'velocity_x', 'velocity_y', 'angular_velocity', 'mass', 'remaining_fuel',
+                 'joint_impulse', 'motor_impulse', 'limit_state', 'normal_impulse', 'tangent_impulse', 'touching',
+                 'contact_top', 'fixture_contact', 'game_over', 'sleep_time', 'position_solved')
+
+
+class BatchedRocketLander:
+    """
+    Steps N rockets with NumPy array operations. Same interface as VecRocketLander: step takes (N, 3) actions and
+    returns (N, 8) states with reward, done and success arrays. Finished rockets are reset automatically and the
+    observation that ended their episode is kept in terminal_states.
+    """
+
+    def __init__(self, n_envs, settings, seed=None):
+        self.n_envs = n_envs
+        self.settings = settings
+        self.np_random = np.random.RandomState(seed)
+        self.bargeHeight = left_const_barge_coordinates[0]
+
+        # Solver iterations of a PHYSICS_PROFILES entry. 'balanced' already lands as often as RocketLander does on
+        # 'reference', which iterates 6 times more. 'fast' runs about 4 times faster, but its few position iterations
+        # leave the legs short of their limits after the first step, so the rocket lands less often.
+        profile = settings.get('Physics Profile', 'balanced')
+        if isinstance(profile, str):
+            assert profile in PHYSICS_PROFILES, 'Physics Profile must be one of {}'.format(list(PHYSICS_PROFILES))
+            profile = PHYSICS_PROFILES[profile]
+        self.velocity_iterations = profile['velocity_iterations']
+        self.position_iterations = profile['position_iterations']
+
+        # Bodies in the rows of HULL and the legs, with the position and velocity of their centre of gravity like
+        # the sweep of a Box2D body
+        self.cog_x = np.zeros((3, n_envs))
+        self.cog_y = np.zeros((3, n_envs))
+        self.angle = np.zeros((3, n_envs))
+        self.velocity_x = np.zeros((3, n_envs))
+        self.velocity_y = np.zeros((3, n_envs))
+        self.angular_velocity = np.zeros((3, n_envs))
+        self.mass = np.zeros(n_envs)  # of the lander fixture, like lander.mass
+        self.remaining_fuel = np.zeros(n_envs)
+
+        # Solver state Box2D carries over from one step to the next: the accumulated impulses it warm starts from and
+        # the joint limits and contacts that are active
+        self.joint_impulse = np.zeros((2, 3, n_envs))  # point constraint x, y and limit of each leg joint
+        self.motor_impulse = np.zeros((2, n_envs))
+        self.limit_state = np.zeros((2, n_envs), dtype=int)  # -1 at the lower limit, +1 at the upper one, 0 inactive
+        self.normal_impulse = np.zeros((len(CONTACT_POINTS), n_envs))
+        self.tangent_impulse = np.zeros((len(CONTACT_POINTS), n_envs))
+        self.touching = np.zeros((len(CONTACT_POINTS), n_envs), dtype=bool)
+        self.contact_top = np.zeros((len(CONTACT_POINTS), n_envs))
+        self.fixture_contact = np.zeros((4, n_envs), dtype=bool)  # with the landing barge, per fixture
+
+        self.game_over = np.zeros(n_envs, dtype=bool)
+        self.sleep_time = np.zeros((3, n_envs))
+        self.position_solved = np.zeros(n_envs, dtype=bool)
+        self.prev_shaping = np.zeros(n_envs)
+        self.steps_limit = np.zeros(n_envs, dtype=int)
+
+        self.states = np.zeros((n_envs, 8))
+        self.terminal_states = np.zeros((n_envs, 8))
+        self.untransformed_states = np.zeros((n_envs, 6))
+        self.rewards = np.zeros(n_envs)
+        self.dones = np.zeros(n_envs, dtype=bool)
+        self.successes = np.zeros(n_envs, dtype=bool)
+
+    def seed(self, seed):
+        self.np_random = np.random.RandomState(seed)
+
+    # ==== Episodes ====
+    def reset(self, mask=None, initial_force=None):
+        """
+        Resets the rockets selected by the boolean mask (all by default) and returns the states
+        :param initial_force: optional (n, 2) forces for the n selected rockets instead of the 'Initial Force' setting
+        """
+        if mask is None:
+            mask = np.ones(self.n_envs, dtype=bool)
+        n = int(mask.sum())
+        if n == 0:
+            return self.states
+
+        # Bodies where RocketLander._create_rocket creates them
+        x0, y0 = rocket_initial_coordinates
+        self.mass[mask] = MASS
+        cog_height = self._hull_mass_properties()[1]
+        self.cog_x[HULL, mask] = x0
+        self.cog_y[HULL, mask] = y0 + cog_height[mask]
+        for leg, i in enumerate(LEG_SIDES, 1):
+            self.cog_x[leg, mask] = x0 - i * LEG_AWAY / SCALE
+            self.cog_y[leg, mask] = y0
+            self.angle[leg, mask] = i * 0.05
+        self.angle[HULL, mask] = 0
+        for name in ('velocity_x', 'velocity_y', 'angular_velocity', 'joint_impulse', 'motor_impulse', 'limit_state',
+                     'normal_impulse', 'tangent_impulse', 'touching', 'fixture_contact', 'game_over', 'sleep_time'):
+            getattr(self, name)[..., mask] = 0
+        self.remaining_fuel[mask] = INITIAL_FUEL_MASS_PERCENTAGE * MASS
+        self.steps_limit[mask] = STEPS_LIMIT
+
+        # The initial force acts during the first step, like the [0, 0, 0] step RocketLander._reset runs
+        if initial_force is not None:
+            initial_force = np.asarray(initial_force, dtype=float).reshape(n, 2)
+        elif isinstance(self.settings['Initial Force'], str):
+            initial_force = np.column_stack([
+                self.np_random.uniform(-INITIAL_RANDOM * 0.3, INITIAL_RANDOM * 0.3, n),
+                self.np_random.uniform(-1.3 * INITIAL_RANDOM, -INITIAL_RANDOM, n)])
+        else:
+            initial_force = np.tile(np.asarray(self.settings['Initial Force'], dtype=float), (n, 1))
+        force = np.zeros((self.n_envs, 2))
+        force[mask] = initial_force
+
+        zero_actions = np.zeros((self.n_envs, 3))
+        self._advance(zero_actions, mask, force)
+        states = self._generate_states()
+        shaping = self._compute_shaping(states)
+        self.prev_shaping[mask] = shaping[mask]
+        self.states[mask] = states[mask]
+        self.steps_limit[mask] -= 1
+        return self.states
+
+    def step(self, actions):
+        """
+        :param actions: (N, 3) array of (Fe, Fs, psi)
+        :return: states (N, 8), rewards (N,), dones (N,), successes (N,)
+        Note: the returned arrays are reused by the next call, copy them if they need to be kept.
+        """
+        actions = np.asarray(actions, dtype=float)
+        assert actions.shape == (self.n_envs, 3), 'Expected actions of shape ({}, 3)'.format(self.n_envs)
+
+        active = np.ones(self.n_envs, dtype=bool)
+        m_power, s_power = self._advance(actions, active)
+        states = self._generate_states()
+        rewards = self._compute_rewards(states, m_power, s_power)
+
+        # Termination, with the same precedence of rewards as RocketLander._step
+        out_of_bounds = (np.abs(states[:, XX]) >= 2.0) | (states[:, YY] < -1) | (states[:, YY] > 3)
+        # Box2D puts the rocket to sleep as a whole, once the position solver has converged
+        asleep = (self.sleep_time.min(axis=0) >= TIME_TO_SLEEP) & self.position_solved
+        steps_limit = self.steps_limit == 0
+        rewards[out_of_bounds] = -10
+        rewards[asleep] = -1000
+        rewards[self.game_over] = 1000
+        rewards[steps_limit] = -10
+        self.steps_limit -= 1
+
+        self.dones[:] = out_of_bounds | asleep | self.game_over | steps_limit
+        self.successes[:] = self.game_over
+        self.rewards[:] = rewards
+        self.states[:] = states
+
+        if self.dones.any():
+            self.terminal_states[self.dones] = states[self.dones]
+            self.reset(self.dones)
+
+        return self.states, self.rewards, self.dones, self.successes
+
+    # ==== Dynamics ====
+    def _hull_mass_properties(self):
+        """Mass of the hull with the nozzle, height of its centre of gravity above the lander origin and inertia"""
+        mass = self.mass + NOZZLE_MASS
+        cog_height = (self.mass * LANDER_CENTER + NOZZLE_MASS * NOZZLE_CENTER) / mass
+        # Box2D keeps the moment of inertia of the lander about its origin, INERTIA, when _decrease_mass sets the mass
+        inertia = INERTIA + NOZZLE_INERTIA - mass * np.square(cog_height)
+        return mass, cog_height, inertia
+
+    def _advance(self, actions, mask, external_force=None):
+        """
+        One world step for the rockets in mask, following b2World.Step: contacts are updated from the positions of
+        the last step, then velocities are integrated and solved, then positions. Returns the engine powers.
+        """
+        kept = ~mask
+        if kept.any():
+            # The solver runs on all rockets, the others get their state back afterwards
+            saved = [getattr(self, name)[..., kept].copy() for name in PHYSICS_STATE]
+
+        # RocketLander._step wraps the angle of the lander, the legs follow here to keep their joint angles
+        angle = self.angle
+        turned = np.where(angle[HULL] > np.pi, -2 * np.pi, np.where(angle[HULL] < -np.pi, 2 * np.pi, 0))
+        angle += turned
+        sin, cos = np.sin(angle[HULL]), np.cos(angle[HULL])
+        dispersion = self.np_random.uniform(-1.0, +1.0, (4, self.n_envs)) / SCALE
+
+        # Main engine, pushing back along the offset of the nozzle origin it fires from, with the dispersion of
+        # RocketLander.__main_engines_force_computation
+        angle_is_normal = (angle[HULL] <= np.pi / 2) & (angle[HULL] > -np.pi / 2)
+        fires = mask & (actions[:, 0] > 0) & angle_is_normal
+        m_power = np.where(fires, (np.clip(actions[:, 0], 0.0, 1.0) + 1.0) * 0.3, 0.0)
+        if self.settings.get('Vectorized Nozzle'):
+            nozzle_angle = np.clip(angle[HULL] + actions[:, 2], -NOZZLE_ANGLE_LIMIT, NOZZLE_ANGLE_LIMIT)
+            hinge = NOZZLE_HINGE
+        else:
+            nozzle_angle = angle[HULL]
+            hinge = 0  # the engine fires from the hull origin
+        nozzle_sin, nozzle_cos = np.sin(nozzle_angle), np.cos(nozzle_angle)
+        along = 4 / SCALE + 2 * dispersion[0]
+        ox = nozzle_sin * along - nozzle_cos * dispersion[1]
+        oy = -nozzle_cos * along - nozzle_sin * dispersion[1]
+        force_x = -ox * MAIN_ENGINE_POWER * m_power
+        force_y = -oy * MAIN_ENGINE_POWER * m_power
+        point_x = hinge * nozzle_sin + ox
+        point_y = -hinge * nozzle_cos + oy
+
+        # Side engines, near the top of the hull as in RocketLander.__side_engines_force_computation
+        s_power = np.zeros(self.n_envs)
+        if self.settings['Side Engines']:
+            fires = mask & (np.abs(actions[:, 1]) > 0.5)
+            s_power[fires] = np.clip(np.abs(actions[fires, 1]), 0.5, 1.0)
+            away = np.sign(actions[:, 1]) * SIDE_ENGINE_AWAY / SCALE
+            side_x = -sin * SIDE_ENGINE_ARM - cos * away
+            side_y = np.abs(cos) * SIDE_ENGINE_ARM - sin * away
+            lateral = 3 * dispersion[3] + away
+            side_force_x = -(sin * dispersion[2] - cos * lateral) * SIDE_ENGINE_POWER * s_power
+            side_force_y = -(-cos * dispersion[2] - sin * lateral) * SIDE_ENGINE_POWER * s_power
+        else:
+            side_x = side_y = side_force_x = side_force_y = 0
+
+        # Decrease the rocket mass. The lander keeps its shape, so the centre of gravity of the hull with the nozzle
+        # moves along the rocket.
+        _, old_cog_height, _ = self._hull_mass_properties()
+        consumed_fuel = 0.009 * (m_power * MAIN_ENGINE_FUEL_COST + s_power * SIDE_ENGINE_FUEL_COST) / SCALE
+        self.mass -= consumed_fuel
+        self.remaining_fuel = np.maximum(self.remaining_fuel - consumed_fuel, 0)
+        hull_mass, cog_height, hull_inertia = self._hull_mass_properties()
+        shift = cog_height - old_cog_height
+        self.cog_x[HULL] -= shift * sin
+        self.cog_y[HULL] += shift * cos
+        self.velocity_x[HULL] -= self.angular_velocity[HULL] * shift * cos
+        self.velocity_y[HULL] -= self.angular_velocity[HULL] * shift * sin
+
+        # Torques about the centre of gravity, at -cog_height * (sin, -cos) from the points relative to the origin
+        cog_x, cog_y = -cog_height * sin, cog_height * cos
+        torque = (point_x - cog_x) * force_y - (point_y - cog_y) * force_x \
+                 + (side_x - cog_x) * side_force_y - (side_y - cog_y) * side_force_x
+        force_x = force_x + side_force_x
+        force_y = force_y + side_force_y
+        if external_force is not None:
+            # Applied to the centre of the lander, like ApplyForceToCenter
+            lander_x, lander_y = -LANDER_CENTER * sin, LANDER_CENTER * cos
+            force_x += external_force[:, 0]
+            force_y += external_force[:, 1]
+            torque += (lander_x - cog_x) * external_force[:, 1] - (lander_y - cog_y) * external_force[:, 0]
+
+        self._collide(cog_height)
+
+        inverse_mass = np.empty((3, self.n_envs))
+        inverse_inertia = np.empty((3, self.n_envs))
+        inverse_mass[HULL], inverse_inertia[HULL] = 1 / hull_mass, 1 / hull_inertia
+        inverse_mass[1:], inverse_inertia[1:] = 1 / LEG_MASS, 1 / LEG_INERTIA
+
+        dt = 1.0 / FPS
+        self.velocity_x[HULL] += dt * force_x * inverse_mass[HULL]
+        self.velocity_y[HULL] += dt * force_y * inverse_mass[HULL]
+        self.angular_velocity[HULL] += dt * torque * inverse_inertia[HULL]
+        self.velocity_y -= dt * BOX2D_GRAVITY
+
+        joints = [self._init_joint(leg, cog_height, inverse_mass, inverse_inertia) for leg in range(2)]
+        contacts = self._init_contacts(self.touching, cog_height, inverse_mass, inverse_inertia, self.normal_impulse,
+                                       self.tangent_impulse)
+        for _ in range(self.velocity_iterations):
+            for leg, joint in enumerate(joints):
+                self._solve_joint_velocity(leg, joint)
+            self._solve_contact_velocity(contacts, self.normal_impulse, self.tangent_impulse)
+
+        start = (self.cog_x.copy(), self.cog_y.copy(), self.angle.copy())
+        self.cog_x += dt * self.velocity_x
+        self.cog_y += dt * self.velocity_y
+        self.angle += dt * self.angular_velocity
+
+        self.position_solved[:] = False
+        for _ in range(self.position_iterations):
+            solved = self._solve_contact_positions(contacts, cog_height, self.contact_top, BAUMGARTE) >= -3 * LINEAR_SLOP
+            for leg, joint in enumerate(joints):
+                solved &= self._solve_joint_position(leg, joint, cog_height)
+            self.position_solved[:] = solved
+            if solved.all():
+                break
+
+        self._solve_time_of_impact(start, cog_height, inverse_mass, inverse_inertia)
+
+        moving = (np.square(self.velocity_x) + np.square(self.velocity_y) > LINEAR_SLEEP_TOLERANCE ** 2) \
+                 | (np.square(self.angular_velocity) > ANGULAR_SLEEP_TOLERANCE ** 2)
+        self.sleep_time = np.where(moving, 0, self.sleep_time + dt)
+
+        if kept.any():
+            for name, values in zip(PHYSICS_STATE, saved):
+                getattr(self, name)[..., kept] = values
+        return m_power, s_power
+
+    # ---- Contacts ----
+    @staticmethod
+    def _local_contact_points(cog_height, points=slice(None)):
+        """Contact points relative to the centre of gravity of their body in body coordinates, each of shape (P, N)"""
+        bodies = CONTACT_BODIES[points]
+        local_x = CONTACT_POINTS[points, 0, None]
+        local_y = CONTACT_POINTS[points, 1, None] - np.where(bodies == HULL, 1, 0)[:, None] * cog_height
+        return local_x, local_y
+
+    def _contact_points(self, cog_height, points=slice(None)):
+        """Contact points relative to the centre of gravity of their body and in the world, each of shape (P, N)"""
+        bodies = CONTACT_BODIES[points]
+        local_x, local_y = self._local_contact_points(cog_height, points)
+        angle = self.angle[bodies]
+        sin, cos = np.sin(angle), np.cos(angle)
+        rx = local_x * cos - local_y * sin
+        ry = local_x * sin + local_y * cos
+        return rx, ry, self.cog_x[bodies] + rx, self.cog_y[bodies] + ry
+
+    def _swept_contact_heights(self, start, end, t, cog_height):
+        """
+        Heights of the contact points at the fractions t of the step along the sweeps of their bodies, which
+        interpolate the centre of gravity and the angle like b2Sweep.GetTransform
+        :param start, end: positions and angles of the bodies at the start and the end of the step
+        :param t: scalar or of shape (P, N)
+        """
+        (_, start_y, start_angle), (_, end_y, end_angle) = start, end
+        local_x, local_y = self._local_contact_points(cog_height)
+        angle = start_angle[CONTACT_BODIES] + t * (end_angle - start_angle)[CONTACT_BODIES]
+        cog_y = start_y[CONTACT_BODIES] + t * (end_y - start_y)[CONTACT_BODIES]
+        return cog_y + local_x * np.sin(angle) + local_y * np.cos(angle)
+
+    def _collide(self, cog_height):
+        """
+        Contacts at the start of the step, like b2World.Step updates them before solving. A point touches a barge
+        within the skin of Box2D polygons, and touching the landing barge is reported like ContactDetector does.
+        """
+        _, _, x, y = self._contact_points(cog_height)
+        top = np.full(x.shape, np.inf)
+        on_landing_barge = np.zeros(x.shape, dtype=bool)
+        for barge_i, (x1, x2, barge_top) in enumerate(BARGES):
+            over = (x >= x1) & (x <= x2)
+            top[over] = barge_top
+            if barge_i == 0:
+                on_landing_barge = over
+        separation = y - top
+        touching = (separation < POLYGON_SKIN) & (separation > -BARGE_MAX_PENETRATION)
+        # Contacts that end lose their impulses, new ones start without
+        self.normal_impulse[~touching] = 0
+        self.tangent_impulse[~touching] = 0
+        self.touching = touching
+        self.contact_top = top
+
+        # ContactDetector.BeginContact runs when a fixture starts touching the landing barge, with the velocity of
+        # the lander from the end of the last step
+        landing_contact = touching & on_landing_barge
+        fixture_contact = np.stack([landing_contact[CONTACT_FIXTURES == f].any(axis=0) for f in range(4)])
+        begin_contact = (fixture_contact & ~self.fixture_contact).any(axis=0)
+        self.fixture_contact = fixture_contact
+        if begin_contact.any():
+            lander_velocity = self._lander_velocity(cog_height)
+            slow = (np.abs(lander_velocity[0]) < 1) & (np.abs(lander_velocity[1]) < 1)
+            self.game_over[begin_contact] = (fixture_contact[:2].all(axis=0) & slow)[begin_contact]
+
+    def _init_contacts(self, touching, cog_height, inverse_mass, inverse_inertia, normal_impulse, tangent_impulse):
+        """
+        b2ContactSolver.InitializeVelocityConstraints and WarmStart for the touching points
+        :return: (point, body, anchor x, anchor y, inverse mass, inverse inertia, normal mass, tangent mass, touching)
+            of every point touching in any rocket
+        """
+        points = np.flatnonzero(touching.any(axis=1))
+        rx, ry, _, _ = self._contact_points(cog_height, points)
+        contacts = []
+        for p, px, py in zip(points, rx, ry):
+            body = CONTACT_BODIES[p]
+            im, ii = inverse_mass[body], inverse_inertia[body]
+            normal_mass = 1 / (im + ii * px * px)
+            tangent_mass = 1 / (im + ii * py * py)
+            normal, tangent = normal_impulse[p], tangent_impulse[p]
+            self.velocity_x[body] += im * tangent
+            self.velocity_y[body] += im * normal
+            self.angular_velocity[body] += ii * (px * normal - py * tangent)
+            contacts.append((p, body, px, py, im, ii, normal_mass, tangent_mass, touching[p]))
+        return contacts
+
+    def _solve_contact_velocity(self, contacts, normal_impulse, tangent_impulse):
+        """Inelastic contacts with Coulomb friction, friction first like b2ContactSolver.SolveVelocityConstraints"""
+        vx, vy, w = self.velocity_x, self.velocity_y, self.angular_velocity
+        for p, body, px, py, im, ii, normal_mass, tangent_mass, touching in contacts:
+            limit = CONTACT_FRICTION[p] * normal_impulse[p]
+            accumulated = np.clip(tangent_impulse[p] - tangent_mass * (vx[body] - w[body] * py), -limit, limit)
+            jt = np.where(touching, accumulated - tangent_impulse[p], 0)
+            tangent_impulse[p] += jt
+            vx[body] += im * jt
+            w[body] -= ii * py * jt
+
+        for p, body, px, py, im, ii, normal_mass, tangent_mass, touching in contacts:
+            accumulated = np.maximum(normal_impulse[p] - normal_mass * (vy[body] + w[body] * px), 0)
+            jn = np.where(touching, accumulated - normal_impulse[p], 0)
+            normal_impulse[p] += jn
+            vy[body] += im * jn
+            w[body] += ii * px * jn
+
+    def _solve_contact_positions(self, contacts, cog_height, top, baumgarte):
+        """Pushes touching points out of the barges, :return: the smallest separation of every rocket"""
+        min_separation = np.zeros(self.n_envs)
+        for p, body, _, _, im, ii, _, _, touching in contacts:
+            rx, _, _, y = self._contact_points(cog_height, [p])
+            separation = np.where(touching, y[0] - top[p] - POLYGON_SKIN, 0)
+            min_separation = np.minimum(min_separation, separation)
+            correction = np.clip(baumgarte * (separation + LINEAR_SLOP), -MAX_LINEAR_CORRECTION, 0)
+            impulse = -correction / (im + ii * rx[0] * rx[0])
+            self.cog_y[body] += im * impulse
+            self.angle[body] += ii * rx[0] * impulse
+        return min_separation
+
+    def _solve_time_of_impact(self, start, cog_height, inverse_mass, inverse_inertia):
+        """
+        Continuous collision like b2World.SolveTOI: a body that hits a barge during the step is moved back to the
+        time of impact, where its contacts are solved without the joints, and then moves on for the rest of the step
+        :param start: positions and angles of the bodies at the start of the step
+        """
+        end = (self.cog_x.copy(), self.cog_y.copy(), self.angle.copy())
+        _, _, x, _ = self._contact_points(cog_height)
+        top = np.full(x.shape, np.inf)
+        for x1, x2, barge_top in BARGES:
+            top[(x >= x1) & (x <= x2)] = barge_top
+        over = np.isfinite(top)
+        start_separation = self._swept_contact_heights(start, end, 0, cog_height) - top - POLYGON_SKIN
+        separation = self._swept_contact_heights(start, end, 1, cog_height) - top - POLYGON_SKIN
+        # b2TimeOfImpact on every body and barge: no impact when the shapes overlap at the start, an impact at the
+        # start when they are within the tolerance of the target distance, else where a point first reaches it on its
+        # arc. Like b2TimeOfImpact, a point that dips below the target during the step but ends above it is missed.
+        point_alpha = np.ones(x.shape)
+        candidates = over & (start_separation > TOI_SEPARATION) & (separation < TOI_SEPARATION)
+        if candidates.any():
+            lower = np.zeros(x.shape)
+            crossing = np.zeros(x.shape, dtype=bool)
+            for sample in range(1, TOI_SAMPLES + 1):
+                below = self._swept_contact_heights(start, end, sample / TOI_SAMPLES, cog_height) - top \
+                        - POLYGON_SKIN < TOI_SEPARATION
+                lower[candidates & ~crossing & ~below] = sample / TOI_SAMPLES
+                crossing |= candidates & below
+            upper = np.minimum(lower + 1 / TOI_SAMPLES, 1)
+            for _ in range(TOI_BISECTIONS):
+                middle = (lower + upper) / 2
+                below = self._swept_contact_heights(start, end, middle, cog_height) - top \
+                        - POLYGON_SKIN < TOI_SEPARATION
+                upper = np.where(below, middle, upper)
+                lower = np.where(below, lower, middle)
+            point_alpha[crossing] = upper[crossing]
+        point_alpha[over & (start_separation < TOI_SEPARATION + TOI_TOLERANCE)] = 0
+        alpha = np.stack([point_alpha[CONTACT_BODIES == body].min(axis=0) for body in range(3)])
+        overlapped = over & (start_separation <= -POLYGON_SKIN)
+        alpha[np.stack([overlapped[CONTACT_BODIES == body].any(axis=0) for body in range(3)])] = 1
+        hit = alpha < 1
+        for values, start_values, end_values in zip((self.cog_x, self.cog_y, self.angle), start, end):
+            values[:] = np.where(hit, start_values + alpha * (end_values - start_values), end_values)
+        if not hit.any():
+            return
+
+        # Contacts of the bodies at their time of impact, solved without warm starting
+        _, _, _, y = self._contact_points(cog_height)
+        separation = y - top - POLYGON_SKIN
+        touching = hit[CONTACT_BODIES] & (separation < 0) & (separation > -BARGE_MAX_PENETRATION)
+        contacts = self._init_contacts(touching, cog_height, inverse_mass, inverse_inertia,
+                                       np.zeros(touching.shape), np.zeros(touching.shape))
+        for _ in range(TOI_POSITION_ITERATIONS):
+            if (self._solve_contact_positions(contacts, cog_height, top, TOI_BAUMGARTE) >= -1.5 * LINEAR_SLOP).all():
+                break
+        normal_impulse, tangent_impulse = np.zeros(touching.shape), np.zeros(touching.shape)
+        for _ in range(self.velocity_iterations):
+            self._solve_contact_velocity(contacts, normal_impulse, tangent_impulse)
+
+        remaining = np.where(hit, (1 - alpha) / FPS, 0)
+        self.cog_x += remaining * self.velocity_x
+        self.cog_y += remaining * self.velocity_y
+        self.angle += remaining * self.angular_velocity
+
+    # ---- Leg joints ----
+    def _joint_anchors(self, leg, cog_height):
+        """Anchors of the joint of leg relative to the centres of gravity of the hull and the leg"""
+        anchor_x, anchor_y = LEG_HULL_ANCHORS[leg]
+        sin, cos = np.sin(self.angle[HULL]), np.cos(self.angle[HULL])
+        hull_x = anchor_x * cos - (anchor_y - cog_height) * sin
+        hull_y = anchor_x * sin + (anchor_y - cog_height) * cos
+        anchor_x, anchor_y = LEG_ANCHORS[leg]
+        sin, cos = np.sin(self.angle[leg + 1]), np.cos(self.angle[leg + 1])
+        return hull_x, hull_y, anchor_x * cos - anchor_y * sin, anchor_x * sin + anchor_y * cos
+
+    def _init_joint(self, leg, cog_height, inverse_mass, inverse_inertia):
+        """b2RevoluteJoint.InitVelocityConstraints with warm starting"""
+        body = leg + 1
+        ma, ia, mb, ib = inverse_mass[HULL], inverse_inertia[HULL], inverse_mass[body], inverse_inertia[body]
+        rax, ray, rbx, rby = self._joint_anchors(leg, cog_height)
+
+        # Effective mass of the point and limit constraints and its inverses
+        k11 = ma + mb + ray * ray * ia + rby * rby * ib
+        k12 = -ray * rax * ia - rby * rbx * ib
+        k13 = -ray * ia - rby * ib
+        k22 = ma + mb + rax * rax * ia + rbx * rbx * ib
+        k23 = rax * ia + rbx * ib
+        k33 = ia + ib
+        det = k11 * (k22 * k33 - k23 * k23) - k12 * (k12 * k33 - k23 * k13) + k13 * (k12 * k23 - k22 * k13)
+        inverse3 = np.array([k22 * k33 - k23 * k23, k13 * k23 - k12 * k33, k12 * k23 - k13 * k22,
+                             k11 * k33 - k13 * k13, k12 * k13 - k11 * k23, k11 * k22 - k12 * k12]) / det
+        det = k11 * k22 - k12 * k12
+        inverse2 = np.array([k22, -k12, k11]) / det
+        motor_mass = 1 / k33
+
+        joint_angle = self.angle[body] - self.angle[HULL] - LEG_REFERENCE_ANGLES[leg]
+        lower, upper = LEG_LIMITS[leg]
+        limit_state = np.where(joint_angle <= lower, -1, np.where(joint_angle >= upper, 1, 0))
+        # Without an active limit the 3x3 system is the 2x2 one of the anchor point, with no limit impulse
+        free = limit_state == 0
+        inverse3[:, free] = 0
+        inverse3[np.ix_([0, 1, 3], free)] = inverse2[:, free]
+        impulse = self.joint_impulse[leg]
+        impulse[2][(limit_state != self.limit_state[leg]) | (limit_state == 0)] = 0
+        self.limit_state[leg] = limit_state
+
+        px, py = impulse[0], impulse[1]
+        angular = self.motor_impulse[leg] + impulse[2]
+        self.velocity_x[HULL] -= ma * px
+        self.velocity_y[HULL] -= ma * py
+        self.angular_velocity[HULL] -= ia * (rax * py - ray * px + angular)
+        self.velocity_x[body] += mb * px
+        self.velocity_y[body] += mb * py
+        self.angular_velocity[body] += ib * (rbx * py - rby * px + angular)
+        return ma, ia, mb, ib, rax, ray, rbx, rby, k13, k23, inverse3, inverse2, motor_mass
+
+    def _solve_joint_velocity(self, leg, joint):
+        """b2RevoluteJoint.SolveVelocityConstraints: the leg motor, then the anchor point together with the limit"""
+        ma, ia, mb, ib, rax, ray, rbx, rby, k13, k23, inverse3, inverse2, motor_mass = joint
+        body = leg + 1
+        vx, vy, w = self.velocity_x, self.velocity_y, self.angular_velocity
+
+        old = self.motor_impulse[leg]
+        new = np.clip(old - motor_mass * (w[body] - w[HULL] - LEG_MOTOR_SPEEDS[leg]),
+                      -LEG_MAX_MOTOR_IMPULSE, LEG_MAX_MOTOR_IMPULSE)
+        self.motor_impulse[leg] = new
+        w[HULL] -= ia * (new - old)
+        w[body] += ib * (new - old)
+
+        c1x = vx[body] - w[body] * rby - vx[HULL] + w[HULL] * ray
+        c1y = vy[body] + w[body] * rbx - vy[HULL] - w[HULL] * rax
+        c2 = w[body] - w[HULL]
+        impulse = self.joint_impulse[leg]
+        limit_state = self.limit_state[leg]
+        i11, i12, i13, i22, i23, i33 = inverse3
+        j11, j12, j22 = inverse2
+        # The 3x3 system, where an active limit would pull the 2x2 one without it
+        ix = -(i11 * c1x + i12 * c1y + i13 * c2)
+        iy = -(i12 * c1x + i22 * c1y + i23 * c2)
+        iz = -(i13 * c1x + i23 * c1y + i33 * c2)
+        accumulated = impulse[2] + iz
+        released = ((limit_state == -1) & (accumulated < 0)) | ((limit_state == 1) & (accumulated > 0))
+        if released.any():
+            rhs_x = -c1x + impulse[2] * k13
+            rhs_y = -c1y + impulse[2] * k23
+            ix = np.where(released, j11 * rhs_x + j12 * rhs_y, ix)
+            iy = np.where(released, j12 * rhs_x + j22 * rhs_y, iy)
+            iz = np.where(released, -impulse[2], iz)
+        impulse += (ix, iy, iz)
+
+        vx[HULL] -= ma * ix
+        vy[HULL] -= ma * iy
+        w[HULL] -= ia * (rax * iy - ray * ix + iz)
+        vx[body] += mb * ix
+        vy[body] += mb * iy
+        w[body] += ib * (rbx * iy - rby * ix + iz)
+
+    def _solve_joint_position(self, leg, joint, cog_height):
+        """b2RevoluteJoint.SolvePositionConstraints, :return: whether the rockets are within tolerance"""
+        ma, ia, mb, ib = joint[:4]
+        motor_mass = joint[-1]
+        body = leg + 1
+        angle = self.angle
+
+        joint_angle = angle[body] - angle[HULL] - LEG_REFERENCE_ANGLES[leg]
+        lower, upper = LEG_LIMITS[leg]
+        limit_state = self.limit_state[leg]
+        at_lower, at_upper = limit_state == -1, limit_state == 1
+        angular_error = np.where(at_lower, lower - joint_angle, np.where(at_upper, joint_angle - upper, 0))
+        correction = np.where(at_lower, np.clip(joint_angle - lower + ANGULAR_SLOP, -MAX_ANGULAR_CORRECTION, 0),
+                              np.where(at_upper, np.clip(joint_angle - upper - ANGULAR_SLOP, 0, MAX_ANGULAR_CORRECTION),
+                                       0))
+        angle[HULL] += ia * motor_mass * correction
+        angle[body] -= ib * motor_mass * correction
+
+        rax, ray, rbx, rby = self._joint_anchors(leg, cog_height)
+        cx = self.cog_x[body] + rbx - self.cog_x[HULL] - rax
+        cy = self.cog_y[body] + rby - self.cog_y[HULL] - ray
+        k11 = ma + mb + ia * ray * ray + ib * rby * rby
+        k12 = -ia * rax * ray - ib * rbx * rby
+        k22 = ma + mb + ia * rax * rax + ib * rbx * rbx
+        det = k11 * k22 - k12 * k12
+        px = -(k22 * cx - k12 * cy) / det
+        py = -(k11 * cy - k12 * cx) / det
+        self.cog_x[HULL] -= ma * px
+        self.cog_y[HULL] -= ma * py
+        angle[HULL] -= ia * (rax * py - ray * px)
+        self.cog_x[body] += mb * px
+        self.cog_y[body] += mb * py
+        angle[body] += ib * (rbx * py - rby * px)
+        return (np.hypot(cx, cy) <= LINEAR_SLOP) & (angular_error <= ANGULAR_SLOP)
+
+    def _lander_velocity(self, cog_height):
+        """Velocity of the centre of gravity of the lander fixture, which Box2D reports as lander.linearVelocity"""
+        arm = LANDER_CENTER - cog_height
+        angle, w = self.angle[HULL], self.angular_velocity[HULL]
+        return self.velocity_x[HULL] - w * arm * np.cos(angle), self.velocity_y[HULL] - w * arm * np.sin(angle)
+
+    # ==== State and rewards ====
+    def _generate_states(self):
+        # Like the state of RocketLander: position of the lander origin, velocity of the lander fixture
+        cog_height = self._hull_mass_properties()[1]
+        angle, angular_velocity = self.angle[HULL], self.angular_velocity[HULL]
+        pos_x = self.cog_x[HULL] + cog_height * np.sin(angle)
+        pos_y = self.cog_y[HULL] - cog_height * np.cos(angle)
+        vel_x, vel_y = self._lander_velocity(cog_height)
+
+        states = np.empty((self.n_envs, 8))
+        states[:, 0] = (pos_x - targetX) / (W / 2)
+        states[:, 1] = (pos_y - (self.bargeHeight + (LEG_DOWN / SCALE))) / (H / 2) - LANDING_VERTICAL_CALIBRATION
+        states[:, 2] = vel_x * (W / 2) / FPS
+        states[:, 3] = vel_y * (H / 2) / FPS
+        states[:, 4] = angle
+        states[:, 5] = 20.0 * angular_velocity / FPS
+        states[:, 6:8] = self.fixture_contact[:2].T
+
+        untransformed = self.untransformed_states
+        untransformed[:, 0] = pos_x
+        untransformed[:, 1] = pos_y
+        untransformed[:, 2] = vel_x
+        untransformed[:, 3] = vel_y
+        untransformed[:, 4] = angle
+        untransformed[:, 5] = angular_velocity
+        return states
+
+    @staticmethod
+    def _compute_shaping(states):
+        shaping = -2000 * np.sqrt(np.square(states[:, 0]) + np.square(states[:, 1])) \
+                  - 10 * np.sqrt(np.square(states[:, 2]) + np.square(states[:, 3])) \
+                  - 1000 * np.abs(states[:, 4]) - 30 * np.abs(states[:, 5]) \
+                  + 20 * states[:, 6] + 20 * states[:, 7]
+        shaping[states[:, 3] > 0] -= 1
+        return shaping
+
+    def _compute_rewards(self, states, main_engine_power, side_engine_power):
+        shaping = self._compute_shaping(states)
+        reward = shaping - self.prev_shaping
+        self.prev_shaping = shaping
+
+        # penalize the use of engines
+        reward -= main_engine_power * 0.3
+        if self.settings['Side Engines']:
+            reward -= side_engine_power * 0.3
+
+        return reward / 10
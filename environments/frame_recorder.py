@@ -0,0 +1,145 @@
+import os
+import queue
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+from constants import FPS
+
+
+BLOCK = 'block'  # wait for a free buffer, the simulation runs at encoding speed when the encoder falls behind
+DROP = 'drop'  # skip the frame, the simulation never waits and the dropped frames are counted
+POLICIES = (BLOCK, DROP)
+_NEW_EPISODE = -1
+_STOP = -2
+
+
+def write_png(file_name, frame, compression=1):
+    """Writes an (height, width, 3) uint8 frame as an RGB png, low compression levels are much faster to encode"""
+    height, width, _ = frame.shape
+    rows = np.zeros((height, width * 3 + 1), dtype=np.uint8)  # every row starts with filter type 0
+    rows[:, 1:] = frame.reshape(height, -1)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    with open(file_name, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), compression)))
+        f.write(chunk(b'IEND', b''))
+
+
+class FrameRecorder:
+    """
+    Encodes rendered frames on a background thread while the simulation keeps running.
+
+    Frames are copied into one of pool_size preallocated buffers and handed to the encoder through a queue, so memory
+    is capped at pool_size frames (2.5 MB each at the default 1300x650). When every buffer is waiting to be encoded,
+    policy decides between blocking the caller ('block') and dropping the frame ('drop').
+
+    fmt 'png' writes episode_XXXX/frame_XXXXXX.png, numbered by step so dropped frames leave gaps.
+    Any other fmt, e.g. 'mp4' or 'gif', writes episode_XXXX.<fmt> through imageio, which is only needed then.
+    """
+
+    def __init__(self, path, fmt='png', pool_size=16, policy=BLOCK, fps=FPS, png_compression=1):
+        assert policy in POLICIES, 'policy must be one of {}'.format(POLICIES)
+        self.path = path
+        self.fmt = fmt
+        self.pool_size = pool_size
+        self.policy = policy
+        self.fps = fps
+        self.png_compression = png_compression
+        os.makedirs(path, exist_ok=True)
+
+        self.buffers = None  # allocated on the first frame, once its shape is known
+        self.free = queue.Queue()
+        self.pending = queue.Queue()
+        for i in range(pool_size):
+            self.free.put(i)
+
+        self.frame_index = 0
+        self.frames_submitted = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.error = None
+        self.worker = threading.Thread(target=self._encode, daemon=True)
+        self.worker.start()
+
+    def capture(self, env):
+        """Renders env offscreen and submits the frame, see submit"""
+        return self.submit(env.render('rgb_array'))
+
+    def submit(self, frame):
+        """
+        Copies frame into a free buffer and queues it for encoding, frame can be reused right after.
+        :return: False if the frame was dropped
+        """
+        if self.error is not None:
+            raise self.error
+        if self.buffers is None:
+            self.buffers = np.empty((self.pool_size,) + frame.shape, dtype=np.uint8)
+        index = self.frame_index
+        self.frame_index += 1
+        if self.policy == BLOCK:
+            buffer = self.free.get()
+        else:
+            try:
+                buffer = self.free.get_nowait()
+            except queue.Empty:
+                self.frames_dropped += 1
+                return False
+        np.copyto(self.buffers[buffer], frame)
+        self.pending.put((buffer, index))
+        self.frames_submitted += 1
+        return True
+
+    def new_episode(self):
+        """Frames submitted from now on go to the next episode's file or directory"""
+        if self.frame_index:
+            self.pending.put((_NEW_EPISODE, 0))
+            self.frame_index = 0
+
+    def close(self):
+        """Waits until every queued frame is encoded"""
+        if self.worker.is_alive():
+            self.pending.put((_STOP, 0))
+            self.worker.join()
+        if self.error is not None:
+            raise self.error
+
+    # ==== Worker thread ====
+    def _encode(self):
+        episode = 0
+        writer = None
+        try:
+            while 1:
+                buffer, index = self.pending.get()
+                if buffer < 0:
+                    if writer is not None:
+                        writer.close()
+                        writer = None
+                    if buffer == _STOP:
+                        return
+                    episode += 1
+                    continue
+                frame = self.buffers[buffer]
+                if self.fmt == 'png':
+                    directory = os.path.join(self.path, 'episode_{:04d}'.format(episode))
+                    os.makedirs(directory, exist_ok=True)
+                    write_png(os.path.join(directory, 'frame_{:06d}.png'.format(index)), frame, self.png_compression)
+                else:
+                    if writer is None:
+                        import imageio
+                        writer = imageio.get_writer(
+                            os.path.join(self.path, 'episode_{:04d}.{}'.format(episode, self.fmt)), fps=self.fps)
+                    writer.append_data(frame)
+                self.frames_written += 1
+                self.free.put(buffer)
+        except Exception as e:
+            self.error = e
+            # Unblock a producer waiting for a buffer, the next submit raises the error
+            for i in range(self.pool_size):
+                self.free.put(i)
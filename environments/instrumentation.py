@@ -0,0 +1,96 @@
+import json
+import time
+from collections import deque
+
+
+PHASES = ('main_engines',  # __main_engines_force_computation
+          'side_engines',  # __side_engines_force_computation
+          'decrease_mass',  # _decrease_mass
+          'world_step',  # world.Step
+          'generate_state',  # __generate_state without world.Step
+          'compute_rewards',  # __compute_rewards
+          'particles')  # _update_particles
+
+
+class StepProfiler:
+    """
+    Per-phase timers and counters of RocketLander._step, enabled by the 'Profile Steps' setting.
+
+    The environment calls mark() at the start of a step and lap(phase) at the end of every phase; time spent between
+    phases is not attributed to any of them. Only perf_counter calls and dict additions happen per phase, and when the
+    setting is off the environment skips the profiler entirely.
+    """
+
+    def __init__(self, history=1000):
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.episode_times = dict.fromkeys(PHASES, 0.0)
+        self.steps = 0
+        self.episode_steps = 0
+        self.episode_count = 0
+        self.particles_created = 0
+        self.episode_particles_created = 0
+        self.bodies = 0
+        self.max_bodies = 0
+        self.episodes = deque(maxlen=history)  # summaries of the last finished episodes
+        self._t = 0.0
+        self._particles_emitted = None
+
+    def mark(self):
+        self._t = time.perf_counter()
+
+    def lap(self, phase):
+        t = time.perf_counter()
+        self.episode_times[phase] += t - self._t
+        self._t = t
+
+    def end_step(self, bodies, particles_emitted):
+        """
+        :param bodies: number of bodies in the world
+        :param particles_emitted: running count of particles emitted by the particle system
+        """
+        self.episode_steps += 1
+        self.bodies = bodies
+        if bodies > self.max_bodies:
+            self.max_bodies = bodies
+        if self._particles_emitted is not None:
+            self.episode_particles_created += particles_emitted - self._particles_emitted
+        self._particles_emitted = particles_emitted
+
+    def end_episode(self):
+        """Adds the current episode to the totals and returns its summary"""
+        summary = self._summary(self.episode_times, self.episode_steps, self.episode_particles_created)
+        summary['episode'] = self.episode_count
+        self.episodes.append(summary)
+
+        for phase in PHASES:
+            self.totals[phase] += self.episode_times[phase]
+            self.episode_times[phase] = 0.0
+        self.steps += self.episode_steps
+        self.particles_created += self.episode_particles_created
+        self.episode_steps = 0
+        self.episode_particles_created = 0
+        self.episode_count += 1
+        return summary
+
+    def _summary(self, times, steps, particles_created):
+        total = sum(times.values())
+        return {
+            'steps': steps,
+            'time_s': dict(times),
+            'time_per_step_us': {phase: times[phase] / steps * 1e6 if steps else 0 for phase in PHASES},
+            'share': {phase: times[phase] / total if total else 0 for phase in PHASES},
+            'bodies': self.bodies,
+            'max_bodies': self.max_bodies,
+            'particles_created': particles_created,
+        }
+
+    def summary(self):
+        """Cumulative timers and counters over all finished episodes"""
+        summary = self._summary(self.totals, self.steps, self.particles_created)
+        summary['episodes'] = self.episode_count
+        return summary
+
+    def export(self, path):
+        """Writes the cumulative summary and the summaries of the last episodes to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump({'summary': self.summary(), 'episodes': list(self.episodes)}, f, indent=2)
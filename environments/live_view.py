@@ -0,0 +1,98 @@
+"""
+Live view of a running simulation that does not slow it down.
+
+The simulation publishes the render geometry of its environment at most target_fps times per second, and a separate
+process draws the most recent one in a pyglet window. States published between two drawn frames are skipped, and
+publishing never waits for the viewer, so the simulation runs at full speed while it is being watched.
+"""
+import multiprocessing as mp
+import queue
+import time
+
+from constants import FPS, VIEWPORT_W, VIEWPORT_H, W, H
+
+
+def draw_scene(viewer, geometry, barges, barge_color):
+    """Draws RocketLander.get_render_geometry output into a gym rendering Viewer, like RocketLander._render"""
+    from gym.envs.classic_control import rendering
+    for barge in barges:
+        viewer.draw_polygon(barge, color=barge_color)
+    for x, y, radius, color in geometry['circles']:
+        t = rendering.Transform(translation=(x, y))
+        viewer.draw_circle(radius, 20, color=color).add_attr(t)
+        viewer.draw_circle(radius, 20, color=color, filled=False, linewidth=2).add_attr(t)
+    for path, fill_color, line_color in geometry['polygons']:
+        viewer.draw_polygon(path, color=fill_color)
+        viewer.draw_polyline(path + [path[0]], color=line_color, linewidth=2)
+    offset = 0.2
+    for x, y in geometry['markers']:
+        viewer.draw_polyline([(x, y - offset), (x, y + offset)], linewidth=2)
+        viewer.draw_polyline([(x - offset, y), (x + offset, y)], linewidth=2)
+
+
+def _viewer_process(geometries):
+    from gym.envs.classic_control import rendering
+    from environments.rocketlander import barge_polygons, BARGE_COLOR
+    viewer = rendering.Viewer(VIEWPORT_W, VIEWPORT_H)
+    viewer.set_bounds(0, W, 0, H)
+    while viewer.isopen:
+        geometry = geometries.get()
+        if geometry is None:
+            break
+        draw_scene(viewer, geometry, barge_polygons, BARGE_COLOR)
+        viewer.render()
+    viewer.close()
+
+
+class LiveView:
+    def __init__(self, target_fps=FPS):
+        self.interval = 1 / target_fps
+        self.last_publish = 0
+        self.frames_published = 0
+        # Holds at most one state, a newer one replaces it if the viewer has not picked it up yet
+        self.geometries = mp.Queue(maxsize=1)
+        self.process = mp.Process(target=_viewer_process, args=(self.geometries,), daemon=True)
+        self.process.start()
+
+    @property
+    def is_open(self):
+        """False once the window was closed"""
+        return self.process.is_alive()
+
+    def publish(self, env):
+        """
+        Hands the current state of env to the viewer if a frame is due, otherwise returns immediately.
+        :return: True if the state was published
+        """
+        now = time.perf_counter()
+        if now - self.last_publish < self.interval or not self.process.is_alive():
+            return False
+        self.last_publish = now
+        geometry = env.get_render_geometry()
+        try:
+            self.geometries.put_nowait(geometry)
+        except queue.Full:
+            try:
+                self.geometries.get_nowait()  # drop the stale state
+            except queue.Empty:
+                pass
+            try:
+                self.geometries.put_nowait(geometry)
+            except queue.Full:
+                return False
+        self.frames_published += 1
+        return True
+
+    def close(self):
+        if self.process.is_alive():
+            try:
+                self.geometries.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.geometries.put(None, timeout=1)
+            except queue.Full:
+                pass
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
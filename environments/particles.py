@@ -0,0 +1,192 @@
+import math
+
+import numpy as np
+from Box2D.b2 import circleShape, fixtureDef
+
+from constants import SCALE, FPS
+
+
+"""
+Exhaust particles are just a decoration: they never collide with the rocket and ContactDetector ignores their
+contacts with the barges, so none of the systems below have any influence on the simulated trajectory.
+All systems share the same interface:
+    emit(mass, x, y, ttl, radius, force, point)  - spawn a particle and push it with force applied at point
+    update()                                      - called once per environment step, after world.Step
+    clear()                                       - remove every particle (on reset)
+    circles()                                     - (x, y, radius, color) of every live particle, for rendering
+"""
+
+PARTICLE_MODES = ('pool', 'array', 'off')
+PARTICLE_CATEGORY = 0x0100  # Box2D category bits of the 'pool' bodies, ContactDetector ignores their contacts
+TTL_DECREMENT = 0.1  # ttl is decreased with every time step to determine if the particle should be removed
+RESTITUTION = 0.3
+
+
+def particle_color(ttl):
+    return max(0.2, 0.2 + ttl), max(0.2, 0.5 * ttl), max(0.2, 0.5 * ttl)
+
+
+def create_particles(mode, world, floors, pool_size=16):
+    """
+    :param mode: 'pool' - recycle a fixed pool of Box2D bodies, 'array' - simulate outside Box2D in NumPy arrays,
+                 'off' - no particles at all
+    :param world: Box2D world of the environment
+    :param floors: (x1, x2, top) of every barge, used by the 'array' mode for bouncing
+    :param pool_size: number of particles kept per kind of particle
+    """
+    if mode == 'pool':
+        return BodyParticles(world, pool_size)
+    if mode == 'array':
+        return ArrayParticles(tuple(world.gravity), floors, pool_size * 2)
+    if mode == 'off' or not mode:
+        return NoParticles()
+    raise ValueError('Unknown particle mode {}, expected one of {}'.format(mode, PARTICLE_MODES))
+
+
+class BodyParticles:
+    """
+    Recycles a fixed pool of Box2D bodies for every kind (mass, radius) of particle. Expired particles are deactivated,
+    which removes them from the broadphase, and the oldest body of a pool is reused when the pool is exhausted.
+    The number of bodies in the world therefore never exceeds the pool size, however long the engines fire.
+    """
+
+    def __init__(self, world, pool_size=16):
+        self.world = world
+        self.pool_size = pool_size
+        self.pools = {}  # (mass, radius) -> [bodies], [next slot]
+        self.live = []
+        self.emitted = 0
+
+    def _create_body(self, mass, radius):
+        p = self.world.CreateDynamicBody(
+            position=(0, 0),
+            angle=0.0,
+            fixtures=fixtureDef(
+                shape=circleShape(radius=radius / SCALE, pos=(0, 0)),
+                density=mass,
+                friction=0.1,
+                categoryBits=PARTICLE_CATEGORY,
+                maskBits=0x001,  # collide only with ground
+                restitution=RESTITUTION)
+        )
+        p.radius = radius / SCALE
+        p.ttl = -1
+        return p
+
+    def emit(self, mass, x, y, ttl, radius, force, point):
+        bodies, next_slot = self.pools.setdefault((mass, radius), ([], [0]))
+        slot = next_slot[0]
+        if len(bodies) < self.pool_size:
+            p = self._create_body(mass, radius)
+            bodies.append(p)
+        else:
+            p = bodies[slot]  # oldest particle of this kind
+        next_slot[0] = (slot + 1) % self.pool_size
+
+        if p.ttl < 0:
+            self.live.append(p)
+        p.position = (x, y)
+        p.angle = 0
+        p.linearVelocity = (0, 0)
+        p.angularVelocity = 0
+        p.active = True
+        p.ttl = ttl
+        p.color = particle_color(ttl)
+        p.ApplyForce(force, point, True)
+        self.emitted += 1
+        return p
+
+    def update(self):
+        alive = []
+        for p in self.live:
+            p.ttl -= TTL_DECREMENT
+            if p.ttl < 0:
+                p.active = False
+            else:
+                p.color = particle_color(p.ttl)
+                alive.append(p)
+        self.live = alive
+
+    def clear(self):
+        for p in self.live:
+            p.ttl = -1
+            p.active = False
+        self.live = []
+
+    def circles(self):
+        for p in self.live:
+            pos = p.position
+            yield pos[0], pos[1], p.radius, p.color
+
+
+class ArrayParticles:
+    """
+    Simulates particles outside of Box2D in a fixed ring of NumPy arrays. Motion is integrated the same way Box2D does
+    (semi-implicit Euler under world gravity) and particles bounce off the top of the barges, but they never enter the
+    physics world.
+    """
+
+    def __init__(self, gravity, floors, capacity=32):
+        self.gravity = np.array(gravity, dtype=float)
+        self.floors = np.array(floors, dtype=float).reshape(-1, 3)
+        self.capacity = capacity
+        self.position = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.radius = np.zeros(capacity)
+        self.ttl = np.full(capacity, -1.0)
+        self.next_slot = 0
+        self.emitted = 0
+
+    def emit(self, mass, x, y, ttl, radius, force, point):
+        i = self.next_slot
+        self.next_slot = (i + 1) % self.capacity
+        r = radius / SCALE
+        body_mass = mass * math.pi * r * r  # density * area, as Box2D computes it
+        self.position[i] = x, y
+        # The force acts for a single step, gravity and position are integrated by update() after world.Step
+        self.velocity[i, 0] = force[0] / body_mass / FPS
+        self.velocity[i, 1] = force[1] / body_mass / FPS
+        self.radius[i] = r
+        self.ttl[i] = ttl
+        self.emitted += 1
+
+    def update(self):
+        alive = self.ttl >= 0
+        if not alive.any():
+            return
+        velocity = self.velocity
+        position = self.position
+        velocity[alive] += self.gravity / FPS
+        position[alive] += velocity[alive] / FPS
+
+        for x1, x2, top in self.floors:
+            hit = alive & (position[:, 0] >= x1) & (position[:, 0] <= x2) \
+                  & (position[:, 1] - self.radius < top) & (velocity[:, 1] < 0)
+            position[hit, 1] = top + self.radius[hit]
+            velocity[hit, 1] *= -RESTITUTION
+
+        self.ttl[alive] -= TTL_DECREMENT
+
+    def clear(self):
+        self.ttl[:] = -1
+
+    def circles(self):
+        for i in np.flatnonzero(self.ttl >= 0):
+            yield self.position[i, 0], self.position[i, 1], self.radius[i], particle_color(self.ttl[i])
+
+
+class NoParticles:
+    """Particles are disabled, e.g. in headless runs"""
+    emitted = 0
+
+    def emit(self, mass, x, y, ttl, radius, force, point):
+        pass
+
+    def update(self):
+        pass
+
+    def clear(self):
+        pass
+
+    def circles(self):
+        return iter(())
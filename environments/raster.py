@@ -0,0 +1,126 @@
+"""
+Software rasterizer used for render(mode='rgb_array'). Draws straight into a preallocated uint8 NumPy frame, so frames
+can be captured on servers without a display. Only the primitives RocketLander needs are supported: convex polygons,
+circles and thick line segments. Every primitive is evaluated on the pixel centres of its bounding box only.
+"""
+import numpy as np
+
+
+def to_uint8(color):
+    return np.array([min(max(c, 0.0), 1.0) * 255 for c in color[:3]], dtype=np.uint8)
+
+
+class OffscreenRenderer:
+    def __init__(self, width, height, bounds, background=(1, 1, 1)):
+        """
+        :param width, height: frame size in pixels
+        :param bounds: (left, right, bottom, top) world coordinates shown in the frame, like Viewer.set_bounds
+        """
+        self.width = width
+        self.height = height
+        left, right, bottom, top = bounds
+        self.left = left
+        self.top = top
+        self.scale_x = width / (right - left)
+        self.scale_y = height / (top - bottom)
+        self.background = np.empty((height, width, 3), dtype=np.uint8)
+        self.background[:] = to_uint8(background)
+        self.frame = np.empty_like(self.background)
+
+    # ==== Coordinates ====
+    def to_pixels(self, points):
+        """World (x, y) points to pixel (column, row) coordinates, rows grow downwards"""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        return np.column_stack([(points[:, 0] - self.left) * self.scale_x, (self.top - points[:, 1]) * self.scale_y])
+
+    def _box(self, min_xy, max_xy):
+        """Clipped pixel bounding box and the pixel centres inside it, None if it is outside of the frame"""
+        x0 = max(int(np.floor(min_xy[0])), 0)
+        y0 = max(int(np.floor(min_xy[1])), 0)
+        x1 = min(int(np.ceil(max_xy[0])) + 1, self.width)
+        y1 = min(int(np.ceil(max_xy[1])) + 1, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        xs = np.arange(x0, x1) + 0.5
+        ys = np.arange(y0, y1)[:, None] + 0.5
+        return (slice(y0, y1), slice(x0, x1)), xs, ys
+
+    # ==== Primitives, in pixel coordinates ====
+    def fill_polygon(self, image, vertices, color, line_color=None, line_width=2):
+        """
+        Convex polygon, vertices in either winding order.
+        With a line_color the outline is drawn in the same pass, centred on the edges like pyglet draws it.
+        """
+        half = line_width / 2 if line_color is not None else 0
+        box = self._box(vertices.min(axis=0) - half, vertices.max(axis=0) + half)
+        if box is None:
+            return
+        region, xs, ys = box
+        edges = np.roll(vertices, -1, axis=0) - vertices
+        # Orient the half planes by the sign of the polygon area
+        orientation = 1.0 if np.sum(vertices[:, 0] * edges[:, 1] - vertices[:, 1] * edges[:, 0]) >= 0 else -1.0
+        # Smallest signed distance of every pixel centre to the edge lines, positive inside
+        distance = np.full((len(ys), len(xs)), np.inf)
+        for (ax, ay), (ex, ey) in zip(vertices, edges):
+            length = np.hypot(ex, ey)
+            if length:
+                np.minimum(distance, orientation * (ex * (ys - ay) - ey * (xs - ax)) / length, out=distance)
+        pixels = image[region]
+        if line_color is None:
+            pixels[distance >= 0] = color
+        else:
+            pixels[distance >= -half] = line_color
+            pixels[distance >= half] = color
+
+    def draw_segment(self, image, start, end, color, width):
+        half = width / 2
+        box = self._box(np.minimum(start, end) - half, np.maximum(start, end) + half)
+        if box is None:
+            return
+        region, xs, ys = box
+        direction = end - start
+        length_squared = float(direction @ direction)
+        if length_squared == 0:
+            t = 0
+        else:
+            t = np.clip(((xs - start[0]) * direction[0] + (ys - start[1]) * direction[1]) / length_squared, 0, 1)
+        dx = xs - (start[0] + t * direction[0])
+        dy = ys - (start[1] + t * direction[1])
+        image[region][dx * dx + dy * dy <= half * half] = color
+
+    def fill_circle(self, image, center, radius, color):
+        box = self._box(center - radius, center + radius)
+        if box is None:
+            return
+        region, xs, ys = box
+        image[region][(xs - center[0]) ** 2 + (ys - center[1]) ** 2 <= radius * radius] = color
+
+    # ==== Scene ====
+    def set_static(self, polygons):
+        """Draws (world vertices, color) polygons that never move, e.g. the barges, into the background once"""
+        for vertices, color in polygons:
+            self.fill_polygon(self.background, self.to_pixels(vertices), to_uint8(color))
+
+    def render(self, geometry):
+        """
+        :param geometry: dict from RocketLander.get_render_geometry
+        :return: (height, width, 3) uint8 frame. The buffer is reused by the next call, copy it to keep it.
+        """
+        frame = self.frame
+        np.copyto(frame, self.background)
+
+        radius_scale = (self.scale_x + self.scale_y) / 2
+        for x, y, radius, color in geometry['circles']:
+            center = self.to_pixels((x, y))[0]
+            self.fill_circle(frame, center, radius * radius_scale + 1, to_uint8(color))
+
+        for vertices, fill_color, line_color in geometry['polygons']:
+            self.fill_polygon(frame, self.to_pixels(vertices), to_uint8(fill_color), to_uint8(line_color))
+
+        black = to_uint8((0, 0, 0))
+        offset = 0.2
+        for x, y in geometry['markers']:
+            self.draw_segment(frame, *self.to_pixels([(x, y - offset), (x, y + offset)]), black, 2)
+            self.draw_segment(frame, *self.to_pixels([(x - offset, y), (x + offset, y)]), black, 2)
+
+        return frame
@@ -0,0 +1,130 @@
+import glob
+import os
+
+import numpy as np
+
+
+# name: (width, dtype) of every recorded column, one row per environment step
+COLUMNS = {
+    'action': (3, np.float32),  # commanded (Fe, Fs, psi)
+    'engine': (3, np.float32),  # applied (main engine power, signed side engine power, nozzle angle)
+    'state': (8, np.float32),  # normalized state
+    'untransformed_state': (6, np.float32),
+    'reward': (1, np.float32),
+    'fuel': (1, np.float32),  # remaining fuel
+    'mass': (1, np.float32),  # lander mass
+}
+CHUNK_PATTERN = 'trajectories_{:06d}.npz'
+
+
+class TrajectoryRecorder:
+    """
+    Records every step into preallocated typed arrays, one per column, which double in size when full.
+
+    Completed episodes are flushed to path every flush_every episodes (1 streams each episode as soon as it ends),
+    after which the buffer is reused, so memory stays bounded by the longest run of buffered episodes.
+    Each flush writes one .npz chunk holding the columns of its episodes back to back plus their 'episode_lengths'.
+    Without a path only the current episode is kept.
+    """
+
+    def __init__(self, path=None, flush_every=1, initial_capacity=1024, compress=False):
+        self.path = path
+        self.flush_every = flush_every
+        self.compress = compress
+        self.capacity = initial_capacity
+        self.columns = {name: np.zeros((initial_capacity, width), dtype=dtype)
+                        for name, (width, dtype) in COLUMNS.items()}
+        self.size = 0  # rows in use, buffered episodes followed by the current one
+        self.episode_start = 0  # first row of the current episode
+        self.episode_lengths = []  # lengths of the buffered, completed episodes
+        self.chunk_index = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self.chunk_index = len(glob.glob(os.path.join(path, CHUNK_PATTERN.replace('{:06d}', '*'))))
+
+    def _grow(self):
+        self.capacity *= 2
+        for name, column in self.columns.items():
+            grown = np.zeros((self.capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+
+    def add_column(self, name, width, dtype=np.float32):
+        """Adds a column for data recorded outside the environment, see record_extra"""
+        if name not in self.columns:
+            self.columns[name] = np.zeros((self.capacity, width), dtype=dtype)
+
+    def record(self, action, engine, state, untransformed_state, reward, fuel, mass):
+        if self.size == self.capacity:
+            self._grow()
+        i = self.size
+        columns = self.columns
+        columns['action'][i] = action
+        columns['engine'][i] = engine
+        columns['state'][i] = state
+        columns['untransformed_state'][i] = untransformed_state
+        columns['reward'][i] = reward
+        columns['fuel'][i] = fuel
+        columns['mass'][i] = mass
+        self.size += 1
+
+    def record_extra(self, name, value):
+        """Sets column name of the last recorded step, e.g. the action indices chosen by an agent"""
+        self.columns[name][self.size - 1] = value
+
+    def current_episode(self, name):
+        """View of a column for the steps of the current episode, valid until the next record call"""
+        return self.columns[name][self.episode_start:self.size]
+
+    def end_episode(self):
+        if self.size == self.episode_start:
+            return
+        self.episode_lengths.append(self.size - self.episode_start)
+        self.episode_start = self.size
+        if self.path is None:
+            self._discard_completed()
+        elif len(self.episode_lengths) >= self.flush_every:
+            self.flush()
+
+    def discard_episode(self):
+        """Drops the steps of the current episode, e.g. when it is abandoned before it is done"""
+        self.size = self.episode_start
+
+    def flush(self):
+        """Writes the completed, buffered episodes to a new chunk"""
+        if self.path is None or not self.episode_lengths:
+            return
+        n = self.episode_start
+        data = {name: column[:n] for name, column in self.columns.items()}
+        data['episode_lengths'] = np.array(self.episode_lengths, dtype=np.int64)
+        file_name = os.path.join(self.path, CHUNK_PATTERN.format(self.chunk_index))
+        (np.savez_compressed if self.compress else np.savez)(file_name, **data)
+        self.chunk_index += 1
+        self._discard_completed()
+
+    def _discard_completed(self):
+        """Moves the rows of the current episode to the start of the buffer"""
+        n = self.episode_start
+        current = self.size - n
+        if n and current:
+            for column in self.columns.values():
+                column[:current] = column[n:self.size]
+        self.size = current
+        self.episode_start = 0
+        self.episode_lengths = []
+
+    def close(self):
+        """Flushes the buffered episodes, the current one is only kept if end_episode was called for it"""
+        self.discard_episode()
+        self.flush()
+
+
+def load_episodes(path):
+    """Yields every recorded episode in path as a dict of column arrays, in recording order"""
+    for file_name in sorted(glob.glob(os.path.join(path, CHUNK_PATTERN.replace('{:06d}', '*')))):
+        with np.load(file_name) as chunk:
+            columns = {name: chunk[name] for name in chunk.files if name != 'episode_lengths'}
+            start = 0
+            for length in chunk['episode_lengths']:
+                yield {name: column[start:start + length] for name, column in columns.items()}
+                start += length
@@ -1,17 +1,21 @@
 import math
 
-from Box2D.b2 import (edgeShape, circleShape, fixtureDef, polygonShape, revoluteJointDef, contactListener)
+from Box2D.b2 import (edgeShape, fixtureDef, polygonShape, revoluteJointDef, contactListener)
 import Box2D
-from gym.envs.classic_control import rendering
 import gym
 from gym import spaces
 from gym.utils import seeding
 import logging
-import pyglet
+from collections import namedtuple
 from itertools import chain
 from constants import *
 import numpy as np
 
+from environments.particles import create_particles, PARTICLE_CATEGORY
+from environments.instrumentation import StepProfiler
+from environments.recorder import TrajectoryRecorder
+from environments.raster import OffscreenRenderer
+
 from constants import BARGE_LENGTH_X1_RATIO, BARGE_LENGTH_X2_RATIO
 
 
@@ -21,6 +25,8 @@ class ContactDetector(contactListener):
         self.env = env
 
     def BeginContact(self, contact):
+        if (contact.fixtureA.filterData.categoryBits | contact.fixtureB.filterData.categoryBits) & PARTICLE_CATEGORY:
+            return  # particles landing on the barge must not re-evaluate game_over
         if self.env.left_barge == contact.fixtureA.body or self.env.left_barge == contact.fixtureB.body:
             for i in range(2):
                 if self.env.legs[i] in [contact.fixtureA.body, contact.fixtureB.body]:
@@ -52,6 +58,8 @@ left_const_barge_coordinates_edges = [
     (left_const_barge_coordinates[3], left_const_barge_coordinates[0]),
     (left_const_barge_coordinates[2], left_const_barge_coordinates[0])
 ]
+barge_polygons = [left_const_barge_coordinates_edges, right_const_barge_coordinates_edges]
+BARGE_COLOR = (0.4, 0.4, 0.4)
 
 top_const_barge, bottom_const_barge, left_const_barge, right_const_barge = right_const_barge_coordinates
 rocket_x, rocket_y = (right_const_barge + left_const_barge) / 2, top_const_barge + 1
@@ -59,6 +67,19 @@ rocket_initial_coordinates = (rocket_x, rocket_y)
 
 targetX = (left_const_barge_coordinates[3] + left_const_barge_coordinates[2]) / 2
 
+# Reasons an episode ends, reported in info['termination'] by _step
+OUT_OF_X_BOUNDS = 'out_of_x_bounds'
+OUT_OF_Y_BOUNDS = 'out_of_y_bounds'
+LANDER_ASLEEP = 'lander_asleep'
+LANDED = 'landed'
+STEP_LIMIT = 'step_limit'
+TERMINATION_REASONS = (OUT_OF_X_BOUNDS, OUT_OF_Y_BOUNDS, LANDER_ASLEEP, LANDED, STEP_LIMIT)
+
+# Everything RocketLander.restore needs to resume an episode, see RocketLander.snapshot
+EnvSnapshot = namedtuple('EnvSnapshot', ['bodies', 'joints', 'mass_data', 'remaining_fuel', 'prev_shaping',
+                                         'steps_limit', 'ground_contact', 'game_over', 'contact_flag', 'state',
+                                         'previous_state', 'untransformed_state', 'episode_done', 'rng_state'])
+
 
 class RocketLander(gym.Env):
     metadata = {
@@ -68,8 +89,11 @@ class RocketLander(gym.Env):
 
     def __init__(self, settings):
         self._seed()
-        self.viewer = rendering.Viewer(VIEWPORT_W, VIEWPORT_H)
-        self.viewer.set_bounds(0, W, 0, H)
+        # The viewer (and with it pyglet and the gym rendering stack) is only created on the first render/refresh
+        # call, so headless workers never open a display context.
+        self.viewer = None
+        # Software renderer of render(mode='rgb_array'), also created on first use
+        self.offscreen = None
         self.world = Box2D.b2World()
 
         self.main_base = None
@@ -78,7 +102,6 @@ class RocketLander(gym.Env):
         self.landing_coordinates = (4.5, 2)
 
         self.lander = None
-        self.particles = []
         self.state = []
         self.prev_shaping = None
 
@@ -88,6 +111,32 @@ class RocketLander(gym.Env):
         self.game_over = False
 
         self.settings = settings
+        # Headless runs never render, so particles are turned off unless explicitly requested
+        self.headless = settings.get('Headless', False)
+        self.particles = create_particles(settings.get('Particles', 'off' if self.headless else 'pool'), self.world,
+                                          [(c[2], c[3], c[0]) for c in (left_const_barge_coordinates,
+                                                                        right_const_barge_coordinates)],
+                                          settings.get('Particle Pool Size', 16))
+        # Name of one of PHYSICS_PROFILES or a dict with the same keys
+        profile = settings.get('Physics Profile', 'reference')
+        if isinstance(profile, str):
+            assert profile in PHYSICS_PROFILES, 'Physics Profile must be one of {}'.format(list(PHYSICS_PROFILES))
+            profile = PHYSICS_PROFILES[profile]
+        self.physics_timestep = profile['timestep']
+        self.velocity_iterations = profile['velocity_iterations']
+        self.position_iterations = profile['position_iterations']
+        self.action_repeat = settings.get('Action Repeat', 1)
+        assert self.action_repeat >= 1, 'Action Repeat must be at least 1'
+        # Termination reasons are always counted, 'Verbose' only controls printing them
+        self.verbose = settings.get('Verbose', not self.headless)
+        self.termination_counts = dict.fromkeys(TERMINATION_REASONS, 0)
+        # Trajectory of every step, written to 'Stats Path' every 'Stats Flush Episodes' episodes if a path is given
+        self.recorder = None
+        self.episode_done = False
+        if settings.get('Gather Stats'):
+            self.recorder = TrajectoryRecorder(settings.get('Stats Path'), settings.get('Stats Flush Episodes', 1))
+        # Per-phase timers of _step, None when disabled so that the checks in _step cost a single comparison
+        self.profiler = StepProfiler() if settings.get('Profile Steps') else None
         self.dynamicLabels = {}
         self.staticLabels = {}
 
@@ -112,47 +161,112 @@ class RocketLander(gym.Env):
 
     def _reset(self):
         self.steps_limit = 10000
-        self._destroy()
+        # Fast reset moves the existing rocket back instead of destroying and rebuilding its bodies and joints
+        fast_reset = self.lander is not None and self.settings.get('Fast Reset', True)
+        if not fast_reset:
+            self._destroy()
 
         self.game_over = False
 
-        self.world.contactListener_bug_workaround = ContactDetector(self)
-        self.world.contactListener = self.world.contactListener_bug_workaround
+        if not fast_reset:
+            self.world.contactListener_bug_workaround = ContactDetector(self)
+            self.world.contactListener = self.world.contactListener_bug_workaround
 
         self.helipad_y = left_const_barge_coordinates[0]
         self.bargeHeight = left_const_barge_coordinates[0]
 
-        self.initial_mass = 0
-        self.remaining_fuel = 0
+        if not fast_reset:
+            self.initial_mass = 0
+            self.remaining_fuel = 0
         self.prev_shaping = 0
         self.CONTACT_FLAG = False
 
         # Engine Stats
-        self.action_history = []
+        if self.recorder is not None:
+            # Only finished episodes are kept, the steps of an episode abandoned by reset are dropped
+            if self.episode_done:
+                self.recorder.end_episode()
+            else:
+                self.recorder.discard_episode()
+        self.episode_done = False
 
         # --- ROCKET ---
-        self._create_rocket(rocket_initial_coordinates)
+        if fast_reset:
+            self._reset_rocket()
+        else:
+            self._create_rocket(rocket_initial_coordinates)
         # --- END ROCKET ---
 
-        return self._step(np.array([0, 0, 0]))[
-            0]  # Step through one action = [0, 0, 0] and return the state, reward etc.
+        return self._initial_step()
+
+    def seed(self, seed=None):
+        return [self._seed(seed)]
 
-    def reset(self):
+    def reset(self, seed=None):
+        """
+        :param seed: reseeds the environment random generator first, which draws the initial force, the particle
+                     dispersion and the disturbances, so the episode is reproducible
+        """
+        if seed is not None:
+            self._seed(seed)
         return self._reset()
 
     def _destroy(self):
-        if not self.main_base: return
+        if not self.lander: return
         self.world.contactListener = None
-        self._clean_particles(True)
+        self.particles.clear()
         self.main_base = None
-        if self.lander:
-            self.world.DestroyBody(self.lander)
-            self.world.DestroyBody(self.legs[0])
-            self.world.DestroyBody(self.legs[1])
+        self.world.DestroyBody(self.lander)
+        self.world.DestroyBody(self.legs[0])
+        self.world.DestroyBody(self.legs[1])
+        self.world.DestroyBody(self.nozzle)
+        self.lander = None
+
+    def _reset_rocket(self):
+        """
+        Puts the existing rocket back to its initial transforms with zero velocities, full mass and no leg contact,
+        then applies the initial force. The number of bodies in the world stays constant over any number of resets.
+        """
+        for body in self.legs + [self.nozzle]:
+            self.world.DestroyJoint(body.joint)
+        self._restore_bodies(self.initial_bodies)
+        self._create_joints()
+        # Recomputed from the fixtures, assigning initial_mass would derive the inertia from the burnt down mass
+        self.lander.ResetMassData()
+        self.remaining_fuel = INITIAL_FUEL_MASS_PERCENTAGE * self.initial_mass
+        for leg in self.legs:
+            leg.ground_contact = False
+        self.particles.clear()
+        self._apply_initial_force()
+
+    def _initial_step(self):
+        """
+        First world step of an episode, in which the initial force acts. Only what produces the first observation is
+        done, i.e. the equivalent of a _step with action [0, 0, 0] without the engines and termination checks.
+        """
+        if self.profiler is not None:
+            self.profiler.mark()  # __generate_state laps world_step, the time before the reset must not count
+        if self.settings.get('Vectorized Nozzle'):
+            self.nozzle.angle = max(-NOZZLE_ANGLE_LIMIT, min(NOZZLE_ANGLE_LIMIT, self.lander.angle))
+
+        self.previous_state = self.state
+        state, self.untransformed_state = self.__generate_state()
+        self.state = state
+        reward = self.__compute_rewards(state, 0, 0, 0)  # sets prev_shaping
+        self.steps_limit -= 1
+
+        if self.recorder is not None:
+            self.recorder.record((0, 0, 0), (0, 0, self.nozzle.angle), state, self.untransformed_state, reward,
+                                 self.remaining_fuel, self.lander.mass)
+
+        return np.array(state)
 
     def _step(self, action):
         assert len(action) == 3  # Fe, Fs, psi
         info = {}
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.mark()
 
         # Shutdown all Engines upon contact with the ground
         if self.CONTACT_FLAG:
@@ -173,23 +287,34 @@ class RocketLander(gym.Env):
         if self.lander.angle < -math.pi:
             self.lander.angle += math.pi * 2
 
+        if profiler is not None:
+            profiler.mark()
         m_power = self.__main_engines_force_computation(action, rocketPart=part)
+        if profiler is not None:
+            profiler.lap('main_engines')
         s_power, engine_dir = self.__side_engines_force_computation(action)
-
-        if self.settings.get('Gather Stats'):
-            self.action_history.append([m_power, s_power * engine_dir, part.angle])
+        if profiler is not None:
+            profiler.lap('side_engines')
 
         # Decrease the rocket ass
+        if profiler is not None:
+            profiler.mark()
         self._decrease_mass(m_power, s_power)
+        if profiler is not None:
+            profiler.lap('decrease_mass')
 
         # State Vector
         self.previous_state = self.state  # Keep a record of the previous state
         state, self.untransformed_state = self.__generate_state()  # Generate state
         self.state = state  # Keep a record of the new state
+        if profiler is not None:
+            profiler.lap('generate_state')
 
         # Rewards for reinforcement learning
         reward = self.__compute_rewards(state, m_power, s_power,
                                         part.angle)  # part angle can be used as part of the reward
+        if profiler is not None:
+            profiler.lap('compute_rewards')
 
         # Check if the game is done, adjust reward based on the final state of the body
         state_reset_conditions = [
@@ -198,32 +323,202 @@ class RocketLander(gym.Env):
             # abs(state[THETA]) > THETA_LIMIT # Rocket tilts greater than the "controllable" limit
         ]
         done = False
+        termination = None  # the last matching reason wins, the same way it determines the reward
         if any(state_reset_conditions):
             done = True
             reward = -10
-            print('Conditions', state_reset_conditions, state[YY], state[XX])
+            termination = OUT_OF_X_BOUNDS if state_reset_conditions[0] else OUT_OF_Y_BOUNDS
+            if self.verbose:
+                print('Conditions', state_reset_conditions, state[YY], state[XX])
         if not self.lander.awake:
             done = True
             reward = -1000
-            print('Lander.awake')
+            termination = LANDER_ASLEEP
+            if self.verbose:
+                print('Lander.awake')
         if self.game_over:
             done = True
             reward = 1000
-            print('Game over')
+            termination = LANDED
+            if self.verbose:
+                print('Game over')
         info['success'] = self.game_over
         if self.steps_limit == 0:
             done = True
             reward = -10
-            print('Steps limit')
+            termination = STEP_LIMIT
+            if self.verbose:
+                print('Steps limit')
             self.steps_limit = 10000
+        info['termination'] = termination
+        if done:
+            self.termination_counts[termination] += 1
+            self.episode_done = True
+
+        if self.recorder is not None:
+            self.recorder.record(action, (m_power, s_power * engine_dir, part.angle), state, self.untransformed_state,
+                                 reward, self.remaining_fuel, self.lander.mass)
 
         self.steps_limit -= 1
+        if profiler is not None:
+            profiler.mark()
         self._update_particles()
+        if profiler is not None:
+            profiler.lap('particles')
+            profiler.end_step(self.world.bodyCount, self.particles.emitted)
+            if done:
+                info['step_profile'] = profiler.end_episode()
 
         return np.array(state), reward, done, info
 
-    def step(self, action):
-        return self._step(action)
+    def step(self, action, repeat=None):
+        """
+        :param action: (Fe, Fs, psi)
+        :param repeat: number of physics steps the action is held for, defaults to the 'Action Repeat' setting.
+                       Rewards of the substeps are summed and stepping stops early when the episode is done.
+        :return: state, reward, done, info (info['substeps'] is the number of physics steps taken)
+        """
+        if repeat is None:
+            repeat = self.action_repeat
+        assert repeat >= 1, 'repeat must be at least 1'
+        if repeat == 1:
+            state, reward, done, info = self._step(action)
+            info['substeps'] = 1
+            return state, reward, done, info
+
+        total_reward = 0
+        for substep in range(repeat):
+            state, reward, done, info = self._step(action)
+            total_reward += reward
+            if done:
+                break
+        info['substeps'] = substep + 1
+        return state, total_reward, done, info
+
+    def snapshot(self):
+        """
+        Captures the state of the episode so that it can be resumed with restore, e.g. to try several action
+        sequences from the same state. Particles are decorative and not part of the snapshot. Only reads the
+        environment, the running episode continues exactly as without the snapshot.
+
+        Box2D also keeps joint and contact impulses for warm starting, body sleep timers and an inertia derived from
+        past mass changes, none of which can be read back. restore resets them, see normalize_solver_state, so all
+        replays from one snapshot are bit-identical to each other, but only agree with the steps that originally
+        followed the snapshot at solver tolerance. Call normalize_solver_state right before snapshot when those have
+        to be repeated exactly too, at the cost of perturbing the running episode in the same way.
+        :return: EnvSnapshot
+        """
+        bodies = self._capture_bodies()
+        joints = tuple(body.joint.motorSpeed for body in self.legs + [self.nozzle])
+        if hasattr(self.np_random, 'bit_generator'):
+            rng_state = self.np_random.bit_generator.state
+        else:
+            rng_state = self.np_random.get_state()
+        return EnvSnapshot(bodies, joints, self._capture_mass_data(), self.remaining_fuel, self.prev_shaping,
+                           self.steps_limit, tuple(leg.ground_contact for leg in self.legs), self.game_over,
+                           self.CONTACT_FLAG, list(self.state), list(self.previous_state),
+                           list(self.untransformed_state), self.episode_done, rng_state)
+
+    def restore(self, snapshot, restore_rng=True):
+        """
+        Restores a snapshot in place, the cost does not depend on how long the episode has been running.
+        Stepping with the same actions afterwards repeats the steps of every other replay from snapshot exactly, see
+        snapshot for how they relate to the steps that originally followed it.
+        :param snapshot: EnvSnapshot from snapshot
+        :param restore_rng: also rewind the random generator, so that dispersion and disturbances repeat
+        :return: state at the time of the snapshot
+        """
+        self._restore_bodies(snapshot.bodies)
+        self._reset_solver_state(snapshot.joints, snapshot.mass_data)
+
+        self.remaining_fuel = snapshot.remaining_fuel
+        self.prev_shaping = snapshot.prev_shaping
+        self.steps_limit = snapshot.steps_limit
+        for leg, ground_contact in zip(self.legs, snapshot.ground_contact):
+            leg.ground_contact = ground_contact
+        self.game_over = snapshot.game_over
+        self.CONTACT_FLAG = snapshot.contact_flag
+        self.state = list(snapshot.state)
+        self.previous_state = list(snapshot.previous_state)
+        self.untransformed_state = list(snapshot.untransformed_state)
+        self.episode_done = snapshot.episode_done
+        if restore_rng:
+            if hasattr(self.np_random, 'bit_generator'):
+                self.np_random.bit_generator.state = snapshot.rng_state
+            else:
+                self.np_random.set_state(snapshot.rng_state)
+
+        self.particles.clear()
+        return np.array(self.state)
+
+    def normalize_solver_state(self):
+        """
+        Resets the Box2D state that snapshot cannot capture the same way restore does, without moving any body.
+        Calling it right before snapshot makes replays from that snapshot repeat the following steps exactly.
+        The warm starting impulses are dropped, so the running episode changes at solver tolerance.
+        """
+        self._reset_solver_state()
+
+    def _reset_solver_state(self, motor_speeds=None, mass_data=None):
+        """
+        Brings the Box2D state that snapshot cannot capture into a reproducible form: the bodies are set to their own
+        transforms and velocities like in restore, the joints are recreated without their warm starting impulses, the
+        contacts are rebuilt from the current transforms and the lander mass data is set from a plain tuple.
+        :param motor_speeds: motor speeds of the leg and nozzle joints, defaults to the current ones
+        :param mass_data: (mass, center, I) of the lander, defaults to the current ones
+        """
+        if motor_speeds is None:
+            motor_speeds = tuple(body.joint.motorSpeed for body in self.legs + [self.nozzle])
+        if mass_data is None:
+            mass_data = self._capture_mass_data()
+
+        self._restore_bodies(self._capture_bodies())
+        for body in self.legs + [self.nozzle]:
+            self.world.DestroyJoint(body.joint)
+        self._create_joints()
+        for body, motor_speed in zip(self.legs + [self.nozzle], motor_speeds):
+            body.joint.motorSpeed = motor_speed
+        self._rebuild_contacts()
+        # Setting massData derives the inertia from the new values, assigning only the mass would depend on the past
+        mass, center, inertia = mass_data
+        self.lander.massData = Box2D.b2MassData(mass=mass, center=center, I=inertia)
+
+    def _capture_mass_data(self):
+        mass_data = self.lander.massData
+        return mass_data.mass, tuple(mass_data.center), mass_data.I
+
+    def _rebuild_contacts(self):
+        """
+        Replaces the Box2D contacts of the moment of the restore with the contacts of the restored transforms.
+        Stale contacts would otherwise start or end at the next step and fire ContactDetector, which re-evaluates
+        game_over. The listener is detached meanwhile, the leg contact flags are restored from the snapshot instead.
+        """
+        listener = self.world.contactListener
+        self.world.contactListener = None
+        contact_manager = self.world.contactManager
+        for contact in list(self.world.contacts):
+            contact_manager.Destroy(contact)
+        for body in self.world.bodies:
+            for fixture in body.fixtures:
+                fixture.Refilter()  # queues the proxies, so FindNewContacts pairs them again
+        contact_manager.FindNewContacts()
+        contact_manager.Collide()  # computes the touching flags of the new contacts
+        self.world.contactListener = listener
+
+    def _snapshot_bodies(self):
+        return [self.lander, self.legs[0], self.legs[1], self.nozzle]
+
+    def _capture_bodies(self):
+        return tuple((tuple(body.position), body.angle, tuple(body.linearVelocity), body.angularVelocity, body.awake)
+                     for body in self._snapshot_bodies())
+
+    def _restore_bodies(self, bodies):
+        for body, (position, angle, velocity, angular_velocity, awake) in zip(self._snapshot_bodies(), bodies):
+            body.awake = False  # zeroes the sleep timer, which cannot be set otherwise
+            body.transform = (position, angle)
+            body.linearVelocity = velocity
+            body.angularVelocity = angular_velocity
+            body.awake = awake
 
     def __main_engines_force_computation(self, action, rocketPart, *args):
         # ----------------------------------------------------------------------------
@@ -250,17 +545,14 @@ class RocketLander(gym.Env):
                 oy = -cos * (4 / SCALE + 2 * dispersion[0]) - sin * dispersion[1]
                 impulse_pos = (rocketPart.position[0] + ox, rocketPart.position[1] + oy)
 
-                # rocketParticles are just a decoration, 3.5 is here to make rocketParticle speed adequate
-                p = self._create_particle(3.5, impulse_pos[0], impulse_pos[1], m_power,
-                                          radius=7)
-
                 rocketParticleImpulse = (ox * MAIN_ENGINE_POWER * m_power, oy * MAIN_ENGINE_POWER * m_power)
                 bodyImpulse = (-ox * MAIN_ENGINE_POWER * m_power, -oy * MAIN_ENGINE_POWER * m_power)
                 point = impulse_pos
                 wake = True
 
                 # Force instead of impulse. This enables proper scaling and values in Newtons
-                p.ApplyForce(rocketParticleImpulse, point, wake)
+                # rocketParticles are just a decoration, 3.5 is here to make rocketParticle speed adequate
+                self.particles.emit(3.5, impulse_pos[0], impulse_pos[1], m_power, 7, rocketParticleImpulse, point)
                 rocketPart.ApplyForce(bodyImpulse, point, wake)
         except:
             print("Error in main engine power.")
@@ -309,9 +601,9 @@ class RocketLander(gym.Env):
                 self.impulsePos = (self.lander.position[0] + dx, self.lander.position[1] + dy)
 
                 try:
-                    p = self._create_particle(1, impulse_pos[0], impulse_pos[1], s_power, radius=3)
-                    p.ApplyForce((ox * SIDE_ENGINE_POWER * s_power, oy * SIDE_ENGINE_POWER * s_power), impulse_pos,
-                                 True)
+                    self.particles.emit(1, impulse_pos[0], impulse_pos[1], s_power, 3,
+                                        (ox * SIDE_ENGINE_POWER * s_power, oy * SIDE_ENGINE_POWER * s_power),
+                                        impulse_pos)
                     self.lander.ApplyForce((-ox * SIDE_ENGINE_POWER * s_power, -oy * SIDE_ENGINE_POWER * s_power),
                                            impulse_pos, True)
                 except:
@@ -323,7 +615,9 @@ class RocketLander(gym.Env):
     def __generate_state(self):
         # ----------------------------------------------------------------------------
         # Update
-        self.world.Step(1.0 / FPS, 6 * 30, 6 * 30)
+        self.world.Step(self.physics_timestep, self.velocity_iterations, self.position_iterations)
+        if self.profiler is not None:
+            self.profiler.lap('world_step')
 
         pos = self.lander.position
         vel = self.lander.linearVelocity
@@ -391,13 +685,7 @@ class RocketLander(gym.Env):
         self.lander.color1 = body_color
         self.lander.color2 = (0, 0, 0)
 
-        if isinstance(self.settings['Initial Force'], str):
-            self.lander.ApplyForceToCenter((
-                self.np_random.uniform(-INITIAL_RANDOM * 0.3, INITIAL_RANDOM * 0.3),
-                self.np_random.uniform(-1.3 * INITIAL_RANDOM, -INITIAL_RANDOM)
-            ), True)
-        else:
-            self.lander.ApplyForceToCenter(self.settings['Initial Force'], True)
+        self._apply_initial_force()
 
         # COG is set in the middle of the polygon by default. x = 0 = middle.
         # self.lander.mass = 25
@@ -419,6 +707,38 @@ class RocketLander(gym.Env):
             leg.ground_contact = False
             leg.color1 = body_color
             leg.color2 = (0, 0, 0)
+            self.legs.append(leg)
+        # ----------------------------------------------------------------------------------------
+        # NOZZLE
+        self.nozzle = self.world.CreateDynamicBody(
+            position=(initial_x, initial_y),
+            angle=0.0,
+            fixtures=fixtureDef(
+                shape=polygonShape(vertices=[(x / SCALE, y / SCALE) for x, y in NOZZLE_POLY]),
+                density=5.0,
+                friction=0.1,
+                categoryBits=0x0040,
+                maskBits=0x003,  # collide only with ground
+                restitution=0.0)  # 0.99 bouncy
+        )
+        self.nozzle.color1 = (0, 0, 0)
+        self.nozzle.color2 = (0, 0, 0)
+        self._create_joints()
+        # ----------------------------------------------------------------------------------------
+        # self.drawlist = [self.nozzle] + [self.lander] + self.legs
+        self.drawlist = self.legs + [self.nozzle] + [self.lander]
+        self.initial_mass = self.lander.mass
+        self.remaining_fuel = INITIAL_FUEL_MASS_PERCENTAGE * self.initial_mass
+        self.initial_bodies = tuple((position, angle, (0, 0), 0, True)
+                                    for position, angle, _, _, _ in self._capture_bodies())
+        return
+
+    def _create_joints(self):
+        """
+        Joints of the legs and the nozzle. Fast reset recreates them, because Box2D keeps the joint impulses of the
+        last step for warm starting and an episode must not depend on the one before it.
+        """
+        for i, leg in zip([-1, +1], self.legs):
             rjd = revoluteJointDef(
                 bodyA=self.lander,
                 bodyB=leg,
@@ -436,22 +756,7 @@ class RocketLander(gym.Env):
                 rjd.lowerAngle = -45 * DEGTORAD
                 rjd.upperAngle = -40 * DEGTORAD
             leg.joint = self.world.CreateJoint(rjd)
-            self.legs.append(leg)
-        # ----------------------------------------------------------------------------------------
-        # NOZZLE
-        self.nozzle = self.world.CreateDynamicBody(
-            position=(initial_x, initial_y),
-            angle=0.0,
-            fixtures=fixtureDef(
-                shape=polygonShape(vertices=[(x / SCALE, y / SCALE) for x, y in NOZZLE_POLY]),
-                density=5.0,
-                friction=0.1,
-                categoryBits=0x0040,
-                maskBits=0x003,  # collide only with ground
-                restitution=0.0)  # 0.99 bouncy
-        )
-        self.nozzle.color1 = (0, 0, 0)
-        self.nozzle.color2 = (0, 0, 0)
+
         rjd = revoluteJointDef(
             bodyA=self.lander,
             bodyB=self.nozzle,
@@ -467,12 +772,15 @@ class RocketLander(gym.Env):
         )
         # The default behaviour of a revolute joint is to rotate without resistance.
         self.nozzle.joint = self.world.CreateJoint(rjd)
-        # ----------------------------------------------------------------------------------------
-        # self.drawlist = [self.nozzle] + [self.lander] + self.legs
-        self.drawlist = self.legs + [self.nozzle] + [self.lander]
-        self.initial_mass = self.lander.mass
-        self.remaining_fuel = INITIAL_FUEL_MASS_PERCENTAGE * self.initial_mass
-        return
+
+    def _apply_initial_force(self):
+        if isinstance(self.settings['Initial Force'], str):
+            self.lander.ApplyForceToCenter((
+                self.np_random.uniform(-INITIAL_RANDOM * 0.3, INITIAL_RANDOM * 0.3),
+                self.np_random.uniform(-1.3 * INITIAL_RANDOM, -INITIAL_RANDOM)
+            ), True)
+        else:
+            self.lander.ApplyForceToCenter(self.settings['Initial Force'], True)
 
     # Problem specific - LINKED
     def _create_barges(self):
@@ -483,37 +791,6 @@ class RocketLander(gym.Env):
             fixtures=fixtureDef(shape=polygonShape(vertices=right_const_barge_coordinates_edges))
         )
 
-    def _create_particle(self, mass, x, y, ttl, radius=3):
-        """
-        Used for both the Main Engine and Side Engines
-        :param mass: Different mass to represent different forces
-        :param x: x position
-        :param y:  y position
-        :param ttl:
-        :param radius:
-        :return:
-        """
-        p = self.world.CreateDynamicBody(
-            position=(x, y),
-            angle=0.0,
-            fixtures=fixtureDef(
-                shape=circleShape(radius=radius / SCALE, pos=(0, 0)),
-                density=mass,
-                friction=0.1,
-                categoryBits=0x0100,
-                maskBits=0x001,  # collide only with ground
-                restitution=0.3)
-        )
-        p.ttl = ttl  # ttl is decreased with every time step to determine if the particle should be destroyed
-        self.particles.append(p)
-        # Check if some particles need cleaning
-        self._clean_particles(False)
-        return p
-
-    def _clean_particles(self, all_particles):
-        while self.particles and (all_particles or self.particles[0].ttl < 0):
-            self.world.DestroyBody(self.particles.pop(0))
-
     def _decrease_mass(self, main_engine_power, side_engine_power):
         x = np.array([float(main_engine_power), float(side_engine_power)])
         consumed_fuel = 0.009 * np.sum(x * (MAIN_ENGINE_FUEL_COST, SIDE_ENGINE_FUEL_COST)) / SCALE
@@ -524,6 +801,7 @@ class RocketLander(gym.Env):
 
     @staticmethod
     def _create_labels(labels):
+        import pyglet
         labels_dict = {}
         y_spacing = 0
         for text in labels:
@@ -535,16 +813,46 @@ class RocketLander(gym.Env):
     """ RENDERING """
 
     def _render(self, mode='rgb_array'):
-        self._render_environment([left_const_barge_coordinates_edges, right_const_barge_coordinates_edges])
+        self._create_viewer()
+        self._render_environment(barge_polygons)
         self._render_lander()
         self.draw_marker(x=self.lander.worldCenter.x, y=self.lander.worldCenter.y)  # Center of Gravity
         self.draw_marker(x=self.landing_coordinates[0], y=self.landing_coordinates[1])
 
-        # return self.viewer.render(return_rgb_array=mode == 'rgb_array')
-
     def render(self, mode='rgb_array'):
+        """
+        'human' draws into the pyglet viewer, which is shown by the next refresh call.
+        'rgb_array' rasterizes the scene offscreen and needs no display.
+        :return: (height, width, 3) uint8 frame for 'rgb_array'. The buffer is reused by the next call.
+        """
+        if mode == 'rgb_array':
+            return self._render_offscreen()
         return self._render(mode)
 
+    def _render_offscreen(self):
+        if self.offscreen is None:
+            width, height = self.settings.get('Frame Size', (VIEWPORT_W, VIEWPORT_H))
+            self.offscreen = OffscreenRenderer(width, height, (0, W, 0, H))
+            self.offscreen.set_static([(barge, BARGE_COLOR) for barge in barge_polygons])
+        return self.offscreen.render(self.get_render_geometry())
+
+    def get_render_geometry(self):
+        """
+        Everything that moves, in world coordinates, for renderers other than the pyglet viewer.
+        :return: dict of 'polygons': [(vertices, fill color, outline color)] of the lander, legs and nozzle,
+                 'circles': [(x, y, radius, color)] of the particles and 'markers': [(x, y)] of the '+' markers
+        """
+        polygons = []
+        for obj in self.drawlist:
+            for f in obj.fixtures:
+                trans = f.body.transform
+                polygons.append(([tuple(trans * v) for v in f.shape.vertices], obj.color1, obj.color2))
+        return {
+            'polygons': polygons,
+            'circles': list(self.particles.circles()),
+            'markers': [tuple(self.lander.worldCenter), tuple(self.landing_coordinates)],
+        }
+
     def refresh(self, mode='human', render=False):
         """
         Used instead of _render in order to draw user defined drawings from controllers, e.g. trajectories
@@ -553,48 +861,66 @@ class RocketLander(gym.Env):
         :param render:
         :return: Viewer
         """
-        # Viewer Creation
-        if self.viewer is None:  # Initial run will enter here
-            self.viewer = rendering.Viewer(VIEWPORT_W, VIEWPORT_H)
-            self.viewer.set_bounds(0, W, 0, H)
+        self._create_viewer()
 
         if render:
             self.render('human')
         return self.viewer.render(return_rgb_array=mode == 'rgb_array')
 
+    def _create_viewer(self):
+        """
+        Creates the viewer on first use. Importing the gym rendering module pulls in pyglet and requires a display,
+        so it is deferred until something is actually drawn.
+        :return: Viewer
+        """
+        if self.viewer is None:  # Initial run will enter here
+            from gym.envs.classic_control import rendering
+            self.viewer = rendering.Viewer(VIEWPORT_W, VIEWPORT_H)
+            self.viewer.set_bounds(0, W, 0, H)
+        return self.viewer
+
+    @property
+    def action_history(self):
+        """(main engine power, signed side engine power, nozzle angle) of every step of the current episode"""
+        if self.recorder is None:
+            return []
+        return self.recorder.current_episode('engine')
+
+    def close(self):
+        if self.recorder is not None:
+            if self.episode_done:
+                self.recorder.end_episode()
+            self.recorder.close()
+        if self.viewer is not None:
+            self.viewer.close()
+            self.viewer = None
+
     def _render_lander(self):
+        from gym.envs.classic_control import rendering
         # --------------------------------------------------------------------------------------------------------------
         # Rocket Lander
         # --------------------------------------------------------------------------------------------------------------
-        # Lander and Particles
-        for obj in self.particles + self.drawlist:
-            for f in obj.fixtures:
-                trans = f.body.transform
-                if type(f.shape) is circleShape:
-                    t = rendering.Transform(translation=trans * f.shape.pos)
-                    self.viewer.draw_circle(f.shape.radius, 20, color=obj.color1).add_attr(t)
-                    self.viewer.draw_circle(f.shape.radius, 20, color=obj.color2, filled=False, linewidth=2).add_attr(t)
-                else:
-                    # Lander
-                    path = [trans * v for v in f.shape.vertices]
-                    self.viewer.draw_polygon(path, color=obj.color1)
-                    path.append(path[0])
-                    self.viewer.draw_polyline(path, color=obj.color2, linewidth=2)
+        geometry = self.get_render_geometry()
+        # Particles
+        for x, y, radius, color in geometry['circles']:
+            t = rendering.Transform(translation=(x, y))
+            self.viewer.draw_circle(radius, 20, color=color).add_attr(t)
+            self.viewer.draw_circle(radius, 20, color=color, filled=False, linewidth=2).add_attr(t)
+
+        # Lander
+        for path, fill_color, line_color in geometry['polygons']:
+            self.viewer.draw_polygon(path, color=fill_color)
+            self.viewer.draw_polyline(path + [path[0]], color=line_color, linewidth=2)
 
     def _update_particles(self):
-        for obj in self.particles:
-            obj.ttl -= 0.1
-            obj.color1 = (max(0.2, 0.2 + obj.ttl), max(0.2, 0.5 * obj.ttl), max(0.2, 0.5 * obj.ttl))
-            obj.color2 = (max(0.2, 0.2 + obj.ttl), max(0.2, 0.5 * obj.ttl), max(0.2, 0.5 * obj.ttl))
-
-        self._clean_particles(False)
+        self.particles.update()
 
     def _render_environment(self, barges):
         # --------------------------------------------------------------------------------------------------------------
         # ENVIRONMENT
         # --------------------------------------------------------------------------------------------------------------
         for barge in barges:
-            self.viewer.draw_polygon(barge, color=(0.4, 0.4, 0.4))
+            self.viewer.draw_polygon(barge, color=BARGE_COLOR)
         # for g in self.ground_polys:
         #     self.viewer.draw_polygon(g, color=(0, 0.5, 1.0))
         # --------------------------------------------------------------------------------------------------------------
@@ -624,7 +950,8 @@ class RocketLander(gym.Env):
                 self.viewer.draw_polygon([(xx, yy) for xx, yy in zip(x, y)], color=color)
 
     def draw_line(self, x, y, color=(0.2, 0.2, 0.2)):
-        self.viewer.draw_polyline([(xx, yy) for xx, yy in zip(x, y)], linewidth=2, color=color)
+        if self.viewer is not None:
+            self.viewer.draw_polyline([(xx, yy) for xx, yy in zip(x, y)], linewidth=2, color=color)
 
     def get_landing_coordinates(self):
         x = (self.landing_barge_coordinates[1][0] - self.landing_barge_coordinates[0][0]) / 2 + \
@@ -633,6 +960,12 @@ class RocketLander(gym.Env):
             min(self.landing_barge_coordinates[2][1], self.landing_barge_coordinates[3][1])
         return [x, y]
 
+    def get_step_profile(self):
+        """Cumulative per-phase timers and counters of _step, None unless the 'Profile Steps' setting is enabled"""
+        if self.profiler is None:
+            return None
+        return self.profiler.summary()
+
     def get_barge_top_edge_points(self):
         return flatten_array(self.landing_barge_coordinates[2:])
 
@@ -647,14 +980,14 @@ class RocketLander(gym.Env):
                               self.get_landing_coordinates()])
 
     def apply_random_x_disturbance(self, epsilon, left_or_right, x_force=2000):
-        if np.random.rand() < epsilon:
+        if self.np_random.uniform() < epsilon:
             if left_or_right:
                 self.apply_disturbance('random', x_force, 0)
             else:
                 self.apply_disturbance('random', -x_force, 0)
 
     def apply_random_y_disturbance(self, epsilon, y_force=2000):
-        if np.random.rand() < epsilon:
+        if self.np_random.uniform() < epsilon:
             self.apply_disturbance('random', 0, -y_force)
 
     def apply_disturbance(self, force, *args):
@@ -669,34 +1002,21 @@ class RocketLander(gym.Env):
                 self.lander.ApplyForceToCenter(force, True)
 
 
-def get_state_sample(samples, normal_state=True, untransformed_state=True):
-    simulation_settings = {'Side Engines': True,
-                           'Clouds': False,
-                           'Vectorized Nozzle': True,
-                           'Graph': False,
-                           'Render': False,
-                           'Starting Y-Pos Constant': 1,
-                           'Initial Force': 'random',
-                           'Rows': 1,
-                           'Columns': 2}
-    env = RocketLander(simulation_settings)
-    env.reset()
-    state_samples = []
-    while len(state_samples) < samples:
-        f_main = np.random.uniform(0, 1)
-        f_side = np.random.uniform(-1, 1)
-        psi = np.random.uniform(-90 * DEGTORAD, 90 * DEGTORAD)
-        action = [f_main, f_side, psi]
-        s, r, done, info = env.step(action)
-        if normal_state:
-            state_samples.append(s)
-        else:
-            state_samples.append(
-                env.get_state_with_barge_and_landing_coordinates(untransformed_state=untransformed_state))
-        if done:
-            env.reset()
-    env.close()
-    return state_samples
+def get_state_sample(samples, normal_state=True, untransformed_state=True, seed=None):
+    """
+    States visited under uniformly random actions, see environments.state_dataset for datasets that do not fit in
+    memory or should be generated in parallel.
+    :param seed: seeds both the environment and the random actions, None is not reproducible
+    """
+    if samples == 0:
+        return []
+    from environments.state_dataset import generate_states
+    if normal_state:
+        layout = 'normal'
+    else:
+        layout = 'barge' if untransformed_state else 'barge_normalized'
+    return list(np.concatenate([chunk.copy() for chunk in generate_states(samples, layout, seed=seed,
+                                                                          dtype=np.float64)]))
 
 
 def flatten_array(the_list):
@@ -0,0 +1,167 @@
+"""
+Datasets of the states RocketLander visits under uniformly random actions, the data behind get_state_sample.
+
+generate_states yields the states in chunks from a single process. build_dataset fills a preallocated .npy file
+through a memory map from a pool of worker processes, so the dataset never has to fit in RAM:
+    python -m environments.state_dataset states.npy 100000000 --layout barge
+The rows are split into shards of shard_size rows. Shard k always starts from a fresh episode seeded with seed + k,
+so a dataset only depends on its seed and shard size, not on the number of workers.
+
+Layouts, i.e. the columns of a row:
+    'normal'            - the observation returned by step
+    'barge'             - get_state_with_barge_and_landing_coordinates(untransformed_state=True)
+    'barge_normalized'  - get_state_with_barge_and_landing_coordinates(untransformed_state=False)
+"""
+import argparse
+import multiprocessing as mp
+import sys
+import time
+
+import numpy as np
+
+from constants import DEGTORAD
+from environments.rocketlander import RocketLander
+
+
+LAYOUTS = ('normal', 'barge', 'barge_normalized')
+SETTINGS = {'Side Engines': True,
+            'Clouds': False,
+            'Vectorized Nozzle': True,
+            'Graph': False,
+            'Render': False,
+            'Starting Y-Pos Constant': 1,
+            'Initial Force': 'random',
+            'Rows': 1,
+            'Columns': 2,
+            'Headless': True}
+ACTION_LOW = np.array([0, -1, -90 * DEGTORAD])
+ACTION_HIGH = np.array([1, 1, 90 * DEGTORAD])
+
+
+def _row(env, s, layout):
+    if layout == 'normal':
+        return s
+    return env.get_state_with_barge_and_landing_coordinates(untransformed_state=layout == 'barge')
+
+
+def row_width(layout, settings=SETTINGS):
+    assert layout in LAYOUTS, 'layout must be one of {}'.format(LAYOUTS)
+    env = RocketLander(settings)
+    width = len(_row(env, env.reset(0), layout))
+    env.close()
+    return width
+
+
+def fill_states(env, rng, out, layout='normal'):
+    """
+    Steps env with uniformly random actions drawn from rng and writes one row per step into out.
+    An episode that ends is reset, env has to be reset before the first call.
+    """
+    actions = rng.uniform(ACTION_LOW, ACTION_HIGH, size=(len(out), 3))
+    for i, action in enumerate(actions):
+        s, r, done, info = env.step(action)
+        out[i] = _row(env, s, layout)
+        if done:
+            env.reset()
+
+
+def generate_states(samples, layout='normal', chunk_size=65536, seed=None, settings=SETTINGS, dtype=np.float32):
+    """
+    Yields samples rows in chunks of up to chunk_size rows.
+    The chunk buffer is reused, so a chunk is only valid until the next one is requested.
+    :param seed: seeds the environment and the random actions, None is not reproducible
+    """
+    assert layout in LAYOUTS, 'layout must be one of {}'.format(LAYOUTS)
+    env = RocketLander(settings)
+    width = len(_row(env, env.reset(seed), layout))
+    rng = np.random.RandomState(seed)
+    buffer = np.empty((min(chunk_size, samples), width), dtype=dtype)
+    try:
+        for start in range(0, samples, chunk_size):
+            chunk = buffer[:min(chunk_size, samples - start)]
+            fill_states(env, rng, chunk, layout)
+            yield chunk
+    finally:
+        env.close()
+
+
+# ==== Parallel generation into a memory mapped file ====
+_worker_env = None
+_worker_job = None
+
+
+def _init_worker(settings, path, layout):
+    global _worker_env, _worker_job
+    _worker_env = RocketLander(settings)
+    _worker_job = path, layout
+
+
+def _fill_shard(task):
+    shard, start, stop, seed = task
+    path, layout = _worker_job
+    out = np.load(path, mmap_mode='r+')
+    _worker_env.reset(seed)
+    fill_states(_worker_env, np.random.RandomState(seed), out[start:stop], layout)
+    out.flush()
+    del out
+    return shard, stop - start
+
+
+def build_dataset(path, samples, layout='normal', workers=None, seed=0, shard_size=65536, settings=SETTINGS,
+                  dtype=np.float32, log=None):
+    """
+    Writes a (samples, row_width(layout)) .npy file, the rows are generated in parallel straight into a memory map.
+    :param log: called with the number of finished rows after every shard, e.g. to report progress
+    :return: read only memory map of the dataset
+    """
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(samples, row_width(layout, settings)))
+    del out
+    tasks = [(shard, start, min(start + shard_size, samples), seed + shard)
+             for shard, start in enumerate(range(0, samples, shard_size))]
+    if workers is None:
+        workers = mp.cpu_count()
+    workers = max(1, min(workers, len(tasks)))
+
+    done = 0
+    if workers == 1:
+        _init_worker(settings, path, layout)
+        results = map(_fill_shard, tasks)
+        pool = None
+    else:
+        pool = mp.Pool(workers, initializer=_init_worker, initargs=(settings, path, layout))
+        results = pool.imap_unordered(_fill_shard, tasks)
+    try:
+        for shard, rows in results:
+            done += rows
+            if log is not None:
+                log(done)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return np.load(path, mmap_mode='r')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Builds a .npy dataset of RocketLander states under random actions')
+    parser.add_argument('path')
+    parser.add_argument('samples', type=int)
+    parser.add_argument('--layout', choices=LAYOUTS, default='normal')
+    parser.add_argument('--workers', type=int, help='processes, defaults to the number of cores')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--shard-size', type=int, default=65536)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+
+    def log(done):
+        elapsed = time.perf_counter() - start
+        print('\r{:>12}/{} rows   {:>10.0f} rows/s'.format(done, args.samples, done / elapsed), end='', flush=True)
+
+    build_dataset(args.path, args.samples, args.layout, args.workers, args.seed, args.shard_size, log=log)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import numpy as np
+
+from environments.rocketlander import RocketLander
+
+
+class VecRocketLander:
+    """
+    Steps N independent RocketLander worlds behind a single step(actions) call.
+
+    Observations, rewards and flags are written into preallocated arrays, so a batched agent can consume them
+    directly. Worlds that finish an episode are reset automatically: their row in the returned observations holds the
+    first observation of the new episode, while the observation that ended the episode is kept in terminal_states.
+    """
+
+    def __init__(self, n_envs, settings, seed=None):
+        assert n_envs > 0, 'At least one environment is required'
+        self.n_envs = n_envs
+        self.settings = settings
+        self.envs = [RocketLander(settings) for _ in range(n_envs)]
+
+        self.observation_space = self.envs[0].observation_space
+        self.action_space = self.envs[0].action_space
+
+        state_size = self.observation_space.shape[0]
+        self.states = np.zeros((n_envs, state_size))
+        self.terminal_states = np.zeros((n_envs, state_size))
+        self.rewards = np.zeros(n_envs)
+        self.dones = np.zeros(n_envs, dtype=bool)
+        self.successes = np.zeros(n_envs, dtype=bool)
+
+        if seed is not None:
+            self.seed(seed)
+
+    def seed(self, seed):
+        """Seeds every world with its own stream: seed, seed + 1, ..., seed + N - 1"""
+        return [env._seed(seed + i) for i, env in enumerate(self.envs)]
+
+    def reset(self):
+        for i, env in enumerate(self.envs):
+            self.states[i] = env.reset()
+        self.dones[:] = False
+        self.successes[:] = False
+        return self.states
+
+    def step(self, actions):
+        """
+        :param actions: (N, 3) array of (Fe, Fs, psi), one row per world
+        :return: states (N, 8), rewards (N,), dones (N,), successes (N,)
+        Note: the returned arrays are reused by the next call, copy them if they need to be kept.
+        """
+        actions = np.asarray(actions)
+        assert actions.shape == (self.n_envs, 3), 'Expected actions of shape ({}, 3)'.format(self.n_envs)
+
+        states, rewards, dones, successes = self.states, self.rewards, self.dones, self.successes
+        for i, env in enumerate(self.envs):
+            s, r, done, info = env.step(actions[i])
+            rewards[i] = r
+            dones[i] = done
+            successes[i] = info['success']
+            if done:
+                self.terminal_states[i] = s
+                states[i] = env.reset()
+            else:
+                states[i] = s
+
+        return states, rewards, dones, successes
+
+    def render(self, index=0, mode='rgb_array'):
+        return self.envs[index].render(mode)
+
+    def close(self):
+        for env in self.envs:
+            env.close()
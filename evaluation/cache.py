@@ -0,0 +1,125 @@
+"""
+Evaluation results cached on disk, so an unchanged configuration is never simulated twice.
+
+Every episode result is stored in a sqlite database under the key of its configuration and its seed. The key is a
+hash of the agent description (its type and gains, or a hash of its Q-tables), the environment settings that affect
+the simulation and CACHE_VERSION, which has to be bumped whenever the dynamics or the rewards change.
+evaluate_cached only simulates the seeds that are missing for a configuration:
+    result = evaluate_cached(pid_tuned2, settings, 'standard')
+"""
+import hashlib
+import json
+import sqlite3
+
+import numpy as np
+
+from agent.pid import PIDAgent
+from agent.qpid import QPIDAgent
+from agent.sparse_qtable import SparseQPIDAgent
+from evaluation.runner import run_seeds, summarize
+
+
+CACHE_VERSION = 2
+DEFAULT_CACHE_PATH = 'evaluation_cache.sqlite'
+# Settings that only change what is printed, recorded or drawn
+IGNORED_SETTINGS = ('Verbose', 'Gather Stats', 'Stats Path', 'Stats Flush Episodes', 'Profile Steps', 'Frame Size')
+# Named seed sets, 'validation' matches the validation seeds of evaluation.gain_search
+SEED_SETS = {
+    'smoke': range(0, 10),
+    'standard': range(0, 200),
+    'large': range(0, 1000),
+    'validation': range(1000000, 1000100),
+}
+
+
+def resolve_seeds(seed_set):
+    """:param seed_set: name of one of SEED_SETS or an iterable of seeds"""
+    if isinstance(seed_set, str):
+        assert seed_set in SEED_SETS, 'seed_set must be one of {} or a list of seeds'.format(list(SEED_SETS))
+        seed_set = SEED_SETS[seed_set]
+    return [int(seed) for seed in seed_set]
+
+
+def describe_agent(agent):
+    """JSON serializable description of everything that determines the actions of agent"""
+    if isinstance(agent, PIDAgent):
+        return {'type': type(agent).__name__, 'gains': agent.gains.tolist()}
+    if isinstance(agent, SparseQPIDAgent):
+        return {'type': type(agent).__name__, 'tables_sha256': agent.tables.digest()}
+    if isinstance(agent, QPIDAgent):
+        tables = np.ascontiguousarray(agent.tables)
+        digest = hashlib.sha256(tables.data)
+        digest.update(str((tables.dtype.str, tables.shape)).encode())
+        return {'type': type(agent).__name__, 'tables_sha256': digest.hexdigest()}
+    raise TypeError('cannot describe an agent of type {}'.format(type(agent).__name__))
+
+
+def config_key(agent_description, settings):
+    settings = {name: value for name, value in settings.items() if name not in IGNORED_SETTINGS}
+    config = {'agent': agent_description, 'settings': settings, 'version': CACHE_VERSION}
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest(), config
+
+
+class EvaluationCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS configs (key TEXT PRIMARY KEY, config TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS episodes (key TEXT, seed INTEGER, total_reward REAL, '
+                                    'success INTEGER, termination TEXT, PRIMARY KEY (key, seed))')
+
+    def get(self, key, seeds):
+        """:return: dict of seed: (total reward, success, termination) of the cached seeds"""
+        results = {}
+        seeds = list(seeds)
+        for start in range(0, len(seeds), 500):  # sqlite limits the number of query parameters
+            batch = seeds[start:start + 500]
+            rows = self.connection.execute(
+                'SELECT seed, total_reward, success, termination FROM episodes WHERE key = ? AND seed IN ({})'.format(
+                    ','.join('?' * len(batch))), [key] + batch)
+            for seed, total_reward, success, termination in rows:
+                results[seed] = (total_reward, bool(success), termination)
+        return results
+
+    def put(self, key, config, results):
+        """:param results: dict of seed: (total reward, success, termination)"""
+        with self.connection:
+            self.connection.execute('INSERT OR IGNORE INTO configs VALUES (?, ?)',
+                                    (key, json.dumps(config, sort_keys=True, default=str)))
+            self.connection.executemany('INSERT OR REPLACE INTO episodes VALUES (?, ?, ?, ?, ?)',
+                                        [(key, seed, float(total_reward), int(bool(success)), termination)
+                                         for seed, (total_reward, success, termination) in results.items()])
+
+    def clear(self, key=None):
+        """Drops the results of configuration key, or of every configuration"""
+        with self.connection:
+            if key is None:
+                self.connection.execute('DELETE FROM episodes')
+                self.connection.execute('DELETE FROM configs')
+            else:
+                self.connection.execute('DELETE FROM episodes WHERE key = ?', (key,))
+                self.connection.execute('DELETE FROM configs WHERE key = ?', (key,))
+
+    def close(self):
+        self.connection.close()
+
+
+def evaluate_cached(agent_factory, settings, seed_set='standard', cache_path=DEFAULT_CACHE_PATH, workers=None):
+    """
+    Like runner.evaluate over the seeds of seed_set, but only the seeds without a cached result are simulated.
+    :param seed_set: name of one of SEED_SETS or an iterable of seeds
+    :return: EvaluationResult, episodes in the order of the seeds
+    """
+    seeds = resolve_seeds(seed_set)
+    key, config = config_key(describe_agent(agent_factory()), settings)
+    cache = EvaluationCache(cache_path)
+    try:
+        results = cache.get(key, seeds)
+        missing = [seed for seed in dict.fromkeys(seeds) if seed not in results]
+        if missing:
+            new_results = dict(zip(missing, run_seeds(agent_factory, settings, missing, workers)))
+            cache.put(key, config, new_results)
+            results.update(new_results)
+    finally:
+        cache.close()
+    return summarize(results[seed] for seed in seeds)
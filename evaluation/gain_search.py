@@ -0,0 +1,179 @@
+"""
+Cross-entropy search for the (Kp, Ki, Kd) gains of the three PID controllers.
+
+Gains are sampled from a normal distribution over their log10, so gains of very different magnitudes (0.001 to 10)
+are searched alike, and sampled gains up to ZERO_GAIN are set to 0. Every candidate of a generation runs the same
+seeded episodes (common random numbers): the initial forces are identical, so the differences in outcome come from
+the gains and far fewer episodes separate good candidates from bad ones. Episodes run across a process pool.
+
+After the last generation the elites of every generation and the hand tuned gains are re-evaluated on a common set
+of validation seeds, disjoint from the training seeds, and written as a ranked gain table:
+    python -m evaluation.gain_search --generations 10 --population 32 --episodes 20 --output gains.json
+which PIDAgent.from_gain_table('gains.json') loads.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import sys
+import time
+
+import numpy as np
+
+from environments.rocketlander import RocketLander
+from agent.pid import PIDAgent, PIDTuned1, PIDTuned2
+from evaluation.runner import run_episode
+
+
+SETTINGS = {'Side Engines': True,
+            'Vectorized Nozzle': True,
+            'Starting Y-Pos Constant': 1,
+            'Initial Force': 'random',
+            'Headless': True}
+ZERO_GAIN = 1e-4
+LOG_BOUNDS = (np.log10(ZERO_GAIN) - 0.5, 2)
+VALIDATION_SEED_OFFSET = 1000000  # validation seeds never overlap the seeds of the generations
+HAND_TUNED = {'PIDTuned1': PIDTuned1.GAINS, 'PIDTuned2': PIDTuned2.GAINS}
+
+
+def to_log(gains):
+    return np.log10(np.maximum(np.asarray(gains, dtype=float), ZERO_GAIN)).ravel()
+
+
+def from_log(log_gains):
+    gains = 10 ** np.asarray(log_gains).reshape(3, 3)
+    gains[gains <= ZERO_GAIN] = 0
+    return gains
+
+
+# ==== Parallel evaluation ====
+_worker_env = None
+
+
+def _init_worker(settings):
+    global _worker_env
+    _worker_env = RocketLander(settings)
+
+
+def _run_candidate_episode(task):
+    candidate, gains, seed = task
+    total_reward, success, _ = run_episode(_worker_env, PIDAgent(gains), seed)
+    return candidate, total_reward, success
+
+
+def evaluate_candidates(pool, candidates, seeds, workers=1):
+    """
+    Runs every candidate on every seed.
+    :param pool: multiprocessing pool of workers processes initialized with _init_worker, None runs in this process
+    :return: (success rate, mean total reward) per candidate
+    """
+    tasks = [(i, np.asarray(gains).tolist(), seed) for i, gains in enumerate(candidates) for seed in seeds]
+    if pool is None:
+        results = map(_run_candidate_episode, tasks)
+    else:
+        results = pool.imap_unordered(_run_candidate_episode, tasks, chunksize=max(1, len(tasks) // (workers * 8)))
+    rewards = np.zeros(len(candidates))
+    successes = np.zeros(len(candidates))
+    for candidate, total_reward, success in results:
+        rewards[candidate] += total_reward
+        successes[candidate] += success
+    return [(s / len(seeds), r / len(seeds)) for s, r in zip(successes, rewards)]
+
+
+def rank(scores):
+    """Indices of scores ordered by success rate, then mean reward, best first"""
+    return sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+
+
+# ==== Search ====
+def search(settings=SETTINGS, generations=10, population=32, episodes=20, elite_fraction=0.2, initial_std=1.0,
+           smoothing=0.7, min_std=0.05, validation_episodes=100, top=10, workers=None, seed=0, log=print):
+    """
+    :param episodes: episodes per candidate and generation, all candidates of a generation share their seeds
+    :param smoothing: weight of the elite statistics when updating the sampling distribution
+    :param min_std: lower bound of the sampling standard deviation in log10 units, keeps the search from collapsing
+    :param top: length of the returned table
+    :return: gain table, list of dicts ordered best first
+    """
+    rng = np.random.RandomState(seed)
+    hand_tuned = [to_log(gains) for gains in HAND_TUNED.values()]
+    mean = np.mean(hand_tuned, axis=0)
+    std = np.full_like(mean, initial_std)
+    n_elite = max(2, int(round(population * elite_fraction)))
+    elites = []  # (log gains, generation) of every generation's elites
+
+    if workers is None:
+        workers = mp.cpu_count()
+    pool = None
+    if workers > 1:
+        pool = mp.Pool(workers, initializer=_init_worker, initargs=(settings,))
+    else:
+        _init_worker(settings)
+
+    try:
+        for generation in range(generations):
+            start = time.perf_counter()
+            samples = np.clip(mean + std * rng.randn(population, mean.size), *LOG_BOUNDS)
+            candidates = [from_log(sample) for sample in samples]
+            if generation == 0:
+                samples[:len(hand_tuned)] = hand_tuned
+                # exactly the hand tuned agents, 10 ** log10(5) is not exactly 5
+                candidates[:len(hand_tuned)] = [np.array(gains, dtype=float) for gains in HAND_TUNED.values()]
+            seeds = [seed + generation * episodes + episode for episode in range(episodes)]
+            scores = evaluate_candidates(pool, candidates, seeds, workers)
+            order = rank(scores)[:n_elite]
+            elite_samples = samples[order]
+            mean = smoothing * elite_samples.mean(axis=0) + (1 - smoothing) * mean
+            std = np.maximum(smoothing * elite_samples.std(axis=0) + (1 - smoothing) * std, min_std)
+            elites.extend((samples[i], generation) for i in order)
+            best_success, best_reward = scores[order[0]]
+            log('generation {:>3}   best success {:>6.1%}   best reward {:>9.1f}   mean std {:.3f}   {:.1f} s'.format(
+                generation, best_success, best_reward, std.mean(), time.perf_counter() - start))
+
+        # Validation, every finalist runs the same episodes
+        finalists = [(from_log(sample), 'generation {}'.format(generation)) for sample, generation in elites]
+        finalists += [(np.array(gains, dtype=float), name) for name, gains in HAND_TUNED.items()]
+        finalists.append((from_log(mean), 'final mean'))
+        seeds = [seed + VALIDATION_SEED_OFFSET + episode for episode in range(validation_episodes)]
+        scores = evaluate_candidates(pool, [gains for gains, _ in finalists], seeds, workers)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    table = []
+    for i in rank(scores)[:top]:
+        gains, source = finalists[i]
+        success_rate, mean_reward = scores[i]
+        table.append({'rank': len(table), 'gains': gains.tolist(), 'success_rate': success_rate,
+                      'mean_reward': mean_reward, 'source': source})
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cross-entropy search of the PID gains')
+    parser.add_argument('--generations', type=int, default=10)
+    parser.add_argument('--population', type=int, default=32)
+    parser.add_argument('--episodes', type=int, default=20, help='episodes per candidate and generation')
+    parser.add_argument('--elite-fraction', type=float, default=0.2)
+    parser.add_argument('--validation-episodes', type=int, default=100)
+    parser.add_argument('--top', type=int, default=10, help='rows of the gain table')
+    parser.add_argument('--workers', type=int, help='processes, defaults to the number of cores')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='pid_gains.json', help='JSON file the gain table is written to')
+    args = parser.parse_args(argv)
+
+    table = search(SETTINGS, args.generations, args.population, args.episodes, args.elite_fraction,
+                   validation_episodes=args.validation_episodes, top=args.top, workers=args.workers, seed=args.seed)
+    for row in table:
+        print('{:>3}   success {:>6.1%}   reward {:>9.1f}   {:<14} {}'.format(
+            row['rank'], row['success_rate'], row['mean_reward'], row['source'],
+            ' '.join('({:.4g}, {:.4g}, {:.4g})'.format(*gains) for gains in row['gains'])))
+    with open(args.output, 'w') as f:
+        json.dump({'settings': SETTINGS, 'seed': args.seed, 'generations': args.generations,
+                   'population': args.population, 'episodes': args.episodes,
+                   'validation_episodes': args.validation_episodes, 'table': table}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import multiprocessing as mp
+from collections import namedtuple
+from functools import partial
+
+from environments.rocketlander import RocketLander, TERMINATION_REASONS
+from agent.pid import PIDAgent, PIDTuned1, PIDTuned2
+from agent.qpid import QPIDAgent
+from agent.sparse_qtable import SparseQPIDAgent
+
+
+EvaluationResult = namedtuple('EvaluationResult', ['rewards', 'successes', 'average_total_rewards', 'total_successes',
+                                                   'terminations', 'termination_counts'])
+
+
+# ==== Agent factories ====
+# Factories have to be picklable, so they are either module level functions or partials of them.
+def pid_tuned1():
+    return PIDTuned1()
+
+
+def pid_tuned2():
+    return PIDTuned2()
+
+
+def pid_agent_from_table(path, rank=0):
+    """Factory for a PIDAgent with the gains of row rank of a gain table written by evaluation.gain_search"""
+    return partial(PIDAgent.from_gain_table, path, rank)
+
+
+def qpid_agent(load_path=None):
+    return QPIDAgent(load_path)
+
+
+def qpid_agent_from(load_path):
+    """Factory for a QPIDAgent with tables loaded from load_path"""
+    return partial(qpid_agent, load_path)
+
+
+def sparse_qpid_agent(load_path=None):
+    return SparseQPIDAgent(load_path=load_path)
+
+
+def sparse_qpid_agent_from(load_path):
+    """Factory for a SparseQPIDAgent with tables loaded from load_path"""
+    return partial(sparse_qpid_agent, load_path)
+
+
+def get_action(agent, s):
+    """Greedy action of any of the agents in the repository"""
+    if isinstance(agent, QPIDAgent):
+        return agent.get_actions(s, 0)
+    return agent.pid_algorithm(s)
+
+
+# ==== Episodes ====
+def run_episode(env, agent, seed=None):
+    """
+    Runs one episode until done.
+    :param seed: seed of the environment random generator (initial force and particle dispersion)
+    :return: total reward, success flag, termination reason
+    """
+    s = env.reset(seed)
+    total_reward = 0
+    while 1:
+        s, r, done, info = env.step(get_action(agent, s))
+        total_reward += r
+        if done:
+            return total_reward, info['success'], info['termination']
+
+
+# Every worker process owns one environment and builds a fresh agent per episode, so the result of an episode only
+# depends on its seed and not on which worker happened to run it.
+_worker_env = None
+_worker_agent_factory = None
+
+
+def _init_worker(settings, agent_factory):
+    global _worker_env, _worker_agent_factory
+    _worker_env = RocketLander(settings)
+    _worker_agent_factory = agent_factory
+
+
+def _run_worker_episode(seed):
+    return run_episode(_worker_env, _worker_agent_factory(), seed)
+
+
+def summarize(episode_results):
+    """Computes the statistics printed by the main scripts from a list of (total reward, success, termination)"""
+    rewards = []
+    successes = []
+    terminations = []
+    termination_counts = dict.fromkeys(TERMINATION_REASONS, 0)
+    average_total_reward = 0
+    average_total_rewards = []
+    for episode, (total_reward, success, termination) in enumerate(episode_results):
+        average_total_reward = average_total_reward + 1 / (episode + 1) * (total_reward - average_total_reward)
+        average_total_rewards.append(average_total_reward)
+        rewards.append(total_reward)
+        successes.append(bool(success))
+        terminations.append(termination)
+        termination_counts[termination] += 1
+    return EvaluationResult(rewards, successes, average_total_rewards, sum(successes), terminations,
+                            termination_counts)
+
+
+def run_seeds(agent_factory, settings, seeds, workers=None):
+    """
+    Runs one episode per seed across a process pool, the results do not depend on the number of workers.
+    :param agent_factory: picklable callable returning a new agent, e.g. pid_tuned2 or qpid_agent_from(path)
+    :param workers: number of processes, defaults to the number of cores. 1 runs in the calling process
+    :return: list of (total reward, success, termination) in the order of seeds
+    """
+    seeds = list(seeds)
+    if workers is None:
+        workers = mp.cpu_count()
+    workers = max(1, min(workers, len(seeds)))
+
+    if workers == 1:
+        _init_worker(settings, agent_factory)
+        return list(map(_run_worker_episode, seeds))
+
+    # Small chunks keep the load balanced since episode lengths vary a lot
+    chunksize = max(1, len(seeds) // (workers * 8))
+    with mp.Pool(workers, initializer=_init_worker, initargs=(settings, agent_factory)) as pool:
+        return list(pool.imap(_run_worker_episode, seeds, chunksize=chunksize))
+
+
+def evaluate(agent_factory, settings, episode_number=200, workers=None, seed=0):
+    """
+    Evaluates an agent over episode_number episodes spread across a process pool.
+    Episode i is seeded with seed + i, so results are reproducible and independent of the number of workers.
+    :return: EvaluationResult
+    """
+    return summarize(run_seeds(agent_factory, settings, range(seed, seed + episode_number), workers))
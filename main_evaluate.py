@@ -0,0 +1,34 @@
+from evaluation.runner import pid_tuned2
+from evaluation.cache import evaluate_cached
+
+
+if __name__ == "__main__":
+    # Settings dict holds all the settings for the rocket lander environment.
+    settings = {'Side Engines': True,
+                'Vectorized Nozzle': True,
+                'Starting Y-Pos Constant': 1,
+                'Initial Force': 'random',  # (6000, -10000)
+                'Headless': True}
+
+    agent_factory = pid_tuned2  # pid_tuned1, pid_tuned2, pid_agent_from_table(path) or qpid_agent_from(load_path)
+    display_name = 'PID2'
+    seed_set = 'standard'  # 200 episodes, see evaluation.cache.SEED_SETS
+    workers = None  # all cores
+
+    # Episodes already evaluated for this agent, settings and seed are read from evaluation_cache.sqlite
+    result = evaluate_cached(agent_factory, settings, seed_set, workers=workers)
+    episode_number = len(result.rewards)
+
+    for episode, (total_reward, termination) in enumerate(zip(result.rewards, result.terminations)):
+        print('Episode:\t{}\tTotal Reward:\t{}\t{}'.format(episode, total_reward, termination))
+
+    total_successes = result.total_successes
+    print('Terminations:', result.termination_counts)
+    print(f'{display_name} success rate {total_successes}/{episode_number} ({total_successes / episode_number * 100}%)')
+    # matplotlib is only loaded once there is something to plot, so workers and imports of this module stay light
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
+    plt.plot(result.average_total_rewards)
+    plt.title(display_name + ' average reward')
+    plt.show()
@@ -1,6 +1,7 @@
 from environments.rocketlander import RocketLander
 from agent.pid import *
-import matplotlib.pyplot as plt
+from environments.frame_recorder import FrameRecorder
+from environments.live_view import LiveView
 
 
 if __name__ == "__main__":
@@ -8,13 +9,20 @@ if __name__ == "__main__":
     settings = {'Side Engines': True,
                 'Vectorized Nozzle': True,
                 'Starting Y-Pos Constant': 1,
-                'Initial Force': 'random'}  # (6000, -10000)}
+                'Initial Force': 'random',  # (6000, -10000)
+                'Verbose': False}  # termination reasons are printed with the episode instead
 
     env = RocketLander(settings)
     s = env.reset()
     agent = PIDTuned2()
     display_name = 'PID2'
     episode_number = 200
+    print_episodes = True
+    live_view = True  # watch in a separate window at up to 60 fps, False draws every step in this process instead
+    record_path = None  # directory the episodes are recorded to as png frames, None disables recording
+
+    viewer = LiveView(target_fps=60) if live_view else None
+    frame_recorder = FrameRecorder(record_path) if record_path is not None else None
 
     # Statistics
     total_reward = 0
@@ -35,20 +43,37 @@ if __name__ == "__main__":
             s, r, done, info = env.step(action)
             total_reward += r
 
-            env.render('human')
-            env.refresh(render=False)
+            if viewer is not None:
+                viewer.publish(env)
+            else:
+                env.render('human')
+                env.refresh(render=False)
+            if frame_recorder is not None:
+                frame_recorder.capture(env)
 
             if done:
-                print('Episode:\t{}\tTotal Reward:\t{}'.format(episode, total_reward))
+                if print_episodes:
+                    print('Episode:\t{}\tTotal Reward:\t{}\t{}'.format(episode, total_reward, info['termination']))
                 average_total_reward = average_total_reward + 1 / (episode + 1) * (
                         total_reward - average_total_reward)
                 average_total_rewards.append(average_total_reward)
                 total_successes += info['success']
                 total_reward = 0
                 env.reset()
+                if frame_recorder is not None:
+                    frame_recorder.new_episode()
                 break
 
+    if viewer is not None:
+        viewer.close()
+    if frame_recorder is not None:
+        frame_recorder.close()
+        print('Frames written:', frame_recorder.frames_written, 'dropped:', frame_recorder.frames_dropped)
+    print('Terminations:', env.termination_counts)
     print(f'{display_name} success rate {total_successes}/{episode_number} ({total_successes / episode_number * 100}%)')
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
     plt.plot(average_total_rewards)
     plt.title(display_name + ' average reward')
     plt.show()
@@ -1,6 +1,7 @@
 from environments.rocketlander import RocketLander
-from agent.qpid import QPIDAgent
-import matplotlib.pyplot as plt
+from agent.qpid import QPIDAgent, N_TABLES
+from agent.replay import ReplayBuffer
+import numpy as np
 
 
 if __name__ == "__main__":
@@ -9,18 +10,33 @@ if __name__ == "__main__":
                 'Clouds': True,
                 'Vectorized Nozzle': True,
                 'Starting Y-Pos Constant': 1,
-                'Initial Force': 'random'}  # (6000, -10000)}
+                'Initial Force': 'random',  # (6000, -10000)
+                'Action Repeat': 1,  # physics steps per decision, e.g. 4 to decide and update the tables at 15 Hz
+                'Verbose': False}  # termination reasons are printed with the episode instead
 
     env = RocketLander(settings)
     s = env.reset()
-    agent = QPIDAgent()
+    load_path = None  # continue training from saved tables
+    save_path = 'qpid_tables.qtbl'
+    agent = QPIDAgent(load_path)
     episode_number = 200
+    print_episodes = True
 
     # Q-tables parameters
     epsilon = 0.9
     lr = 0.2
     discount = 0.9
 
+    # Experience replay, every step is stored and replay_batches sampled batches are learned from per step
+    replay = None  # e.g. ReplayBuffer(100000), None only learns from every step once
+    replay_batch_size = 256
+    replay_batches = 1
+
+    # With 'Gather Stats' the chosen coefficients are recorded too, so ReplayBuffer.add_recorded can learn from the
+    # recorded episodes offline
+    if env.recorder is not None:
+        env.recorder.add_column('k_indices', N_TABLES, np.uint8)
+
     # Statistics
     total_reward = 0
     average_total_reward = 0
@@ -36,13 +52,19 @@ if __name__ == "__main__":
             total_reward += r
 
             agent.update_tables(s, r, lr, discount)
+            if replay is not None:
+                replay.add(agent.prev_s_d, agent.prev_k_indices, s, r, done)
+                replay.update(agent.tables, lr, discount, replay_batch_size, replay_batches)
+            if env.recorder is not None:
+                env.recorder.record_extra('k_indices', agent.prev_k_indices)
 
             # if episode % 10 == 0 or (episode > 50 and episode % 5 == 0) or (episode > 100 and episode % 2 == 0) or episode > 150:
             #     env.render('human')
             #     env.refresh(render=False)
 
             if done:
-                print('Episode:\t{}\tTotal Reward:\t{}'.format(episode, total_reward))
+                if print_episodes:
+                    print('Episode:\t{}\tTotal Reward:\t{}\t{}'.format(episode, total_reward, info['termination']))
                 average_total_reward = average_total_reward + 1 / (episode + 1) * (
                             total_reward - average_total_reward)
                 average_total_rewards.append(average_total_reward)
@@ -51,7 +73,12 @@ if __name__ == "__main__":
                 env.reset()
                 break
 
+    agent.save_tables(save_path)
+    print('Terminations:', env.termination_counts)
     print(f'QPID success rate {total_successes}/{episode_number} ({total_successes / episode_number * 100}%)')
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
     plt.plot(average_total_rewards)
     plt.title('QPID average reward')
     plt.show()
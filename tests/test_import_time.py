@@ -0,0 +1,11 @@
+import pytest
+
+from benchmarks.import_time import MODULES, BUDGET_MS, TOTAL_BUDGET_MS, measure
+
+
+@pytest.mark.parametrize('module', MODULES)
+def test_import_stays_within_budget(module):
+    result = measure(module)
+    assert not result['forbidden']
+    assert result['own_ms'] <= BUDGET_MS
+    assert result['total_ms'] <= TOTAL_BUDGET_MS, result['slowest_packages_ms']
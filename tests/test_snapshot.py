@@ -0,0 +1,90 @@
+from environments.rocketlander import RocketLander
+from agent.pid import PIDTuned2
+
+
+SETTINGS = {'Side Engines': True,
+            'Vectorized Nozzle': True,
+            'Starting Y-Pos Constant': 1,
+            'Initial Force': 'random',
+            'Headless': True}
+
+
+def rollout(env, agent, steps):
+    """Steps env with agent until done or steps steps, :return: actions and (state, reward, done, termination)"""
+    s = env.state
+    actions, trajectory = [], []
+    for _ in range(steps):
+        action = agent.pid_algorithm(s)
+        s, r, done, info = env.step(action)
+        actions.append(action)
+        trajectory.append((tuple(s), r, done, info['termination']))
+        if done:
+            break
+    return actions, trajectory
+
+
+def replay(env, actions):
+    trajectory = []
+    for action in actions:
+        s, r, done, info = env.step(action)
+        trajectory.append((tuple(s), r, done, info['termination']))
+        if done:
+            break
+    return trajectory
+
+
+def test_replay_after_restore_matches_original():
+    # Seed 7 touches down around step 5400, stale contacts used to end the first replayed step with a landing
+    env = RocketLander(SETTINGS)
+    env.reset(7)
+    agent = PIDTuned2()
+    rollout(env, agent, 5400)
+    env.normalize_solver_state()
+    snapshot = env.snapshot()
+    actions, original = rollout(env, agent, 400)
+
+    for _ in range(2):
+        assert (env.restore(snapshot) == snapshot.state).all()
+        assert replay(env, actions) == original
+
+
+def test_restore_after_episode_end():
+    env = RocketLander(dict(SETTINGS, Particles='pool'))
+    env.reset(5)
+    agent = PIDTuned2()
+    rollout(env, agent, 50)
+    env.normalize_solver_state()
+    snapshot = env.snapshot()
+    actions, original = rollout(env, agent, 10000)
+    assert original[-1][2]
+
+    env.restore(snapshot)
+    assert replay(env, actions) == original
+
+
+def test_replays_without_normalizing_match_each_other():
+    env = RocketLander(SETTINGS)
+    env.reset(7)
+    agent = PIDTuned2()
+    rollout(env, agent, 300)
+    snapshot = env.snapshot()
+    actions, _ = rollout(env, agent, 300)
+
+    env.restore(snapshot)
+    first = replay(env, actions)
+    env.restore(snapshot)
+    assert replay(env, actions) == first
+
+
+def test_snapshot_does_not_change_the_episode():
+    env = RocketLander(SETTINGS)
+    env.reset(7)
+    _, original = rollout(env, PIDTuned2(), 1000)
+
+    env.reset(7)
+    agent = PIDTuned2()  # the controllers integrate the error, so every run needs its own agent
+    trajectory = []
+    for _ in range(20):
+        env.snapshot()
+        trajectory += rollout(env, agent, 50)[1]
+    assert trajectory == original
@@ -0,0 +1,45 @@
+import numpy as np
+
+from agent.qpid import QPIDAgent, N_TABLES, N_K
+from agent.batched_qpid import N_CELLS, td_update
+from agent.replay import ReplayBuffer, flat_view
+
+
+def transitions(n, reward=1.0):
+    """n copies of one transition from cell 0 to cell 1, all tables choosing k index 2"""
+    return (np.zeros(n, dtype=np.intp), np.full((n, N_TABLES), 2, dtype=np.intp), np.full(n, reward),
+            np.zeros(n), np.ones(n, dtype=np.intp))
+
+
+def test_identical_transitions_move_q_by_one_step():
+    lr = 0.2
+    for n in (1, 7, 256):
+        tables = QPIDAgent.new_tables()
+        flat_tables = flat_view(tables)
+        s_d, k_indices, rewards, angle_rewards, new_s_d = transitions(n)
+        td_update(flat_tables, s_d, k_indices, rewards, angle_rewards, new_s_d, lr, 0.9)
+        assert np.allclose(flat_tables[0, :N_TABLES - 3, 2], lr * 1.0)
+        assert np.all(flat_tables[0, N_TABLES - 3:] == 0)
+        assert np.count_nonzero(flat_tables) == N_TABLES - 3
+
+
+def test_colliding_transitions_move_towards_their_mean_target():
+    tables = np.zeros((N_CELLS, N_TABLES, N_K))
+    s_d, k_indices, _, angle_rewards, new_s_d = transitions(4)
+    td_update(tables, s_d, k_indices, np.array([0., 1., 2., 3.]), angle_rewards, new_s_d, 0.5, 0.9)
+    assert np.allclose(tables[0, 0, 2], 0.5 * 1.5)
+
+
+def test_replay_update_is_one_step_per_batch():
+    tables = QPIDAgent.new_tables()
+    buffer = ReplayBuffer(1000, seed=0)
+    buffer.add_batch(*transitions(1))
+    buffer.update(tables, 0.2, 0.9)  # fewer transitions than batch_size, nothing is learned yet
+    assert not tables.any()
+
+    buffer.add_batch(*transitions(255))
+    buffer.update(tables, 0.2, 0.9)
+    assert np.allclose(flat_view(tables)[0, 0, 2], 0.2)
+    for _ in range(5):
+        buffer.update(tables, 0.2, 0.9)
+    assert np.allclose(flat_view(tables)[0, 0, 2], 1 - 0.8 ** 6)